@@ -1,8 +1,20 @@
 """
 Set global unit registry for use throughout the software package
+
+The registry is built lazily on first use and cached for the life of the process, so short-lived
+CLI and worker invocations that never touch a Quantity do not pay for parsing the unit definitions.
+It is still registered as the pint application registry at import, so Quantities unpickled in
+worker processes land in the same registry.
 """
 
-from pint import UnitRegistry, set_application_registry
-ureg = UnitRegistry(system='mks')
+from pint import set_application_registry
+from pint.registry import LazyRegistry
+ureg = LazyRegistry(kwargs={'system': 'mks'})
 set_application_registry(ureg)
-Q_ = ureg.Quantity
+
+
+def Q_(value, units=None):
+    """
+    Build a Quantity in the package registry (ureg.Quantity without forcing the registry at import).
+    """
+    return ureg.Quantity(value, units)
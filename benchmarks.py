@@ -0,0 +1,216 @@
+"""
+Benchmarks: times the finite difference solver across grid sizes and simulated durations, and the
+closed-form functions in single-call and batched form, with and without pint units. Results are
+saved as JSON. A previous results file can be given as a baseline to flag throughput regressions.
+
+    python benchmarks.py --output bench.json
+    python benchmarks.py --output new.json --baseline bench.json --tolerance 0.2
+    python benchmarks.py --import-budget
+
+Import-time budget: the CLI and worker processes are short-lived, so startup matters. Importing a
+module must not build the unit registry, load scipy or load matplotlib; those happen on first use.
+IMPORT_BUDGETS gives the cumulative import time allowed for each entry point, in milliseconds, as
+measured by `python -X importtime`. Most of the remainder is importing pint and numpy.
+"""
+
+from __init__ import ureg, Q_
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time as _time
+import numpy as np
+import calc_functions as cf
+
+# Ceramic plancha from main.py. It has the largest stable dt, so fine grids stay affordable.
+THICKNESS = Q_(1, ureg.cm).to(ureg.meter)
+WIDTH = Q_(45, ureg.cm).to(ureg.meter)
+FLUX = Q_(4500, ureg.watts / ureg.meter**2)
+T_AMB = Q_(27, ureg.degC).to(ureg.degK)
+T_I = Q_(305, ureg.degK)
+T_S = Q_(250, ureg.degC).to(ureg.degK)
+H_AIR = Q_(15, ureg.watts / (ureg.meter**2 * ureg.degK))
+RHO = Q_(2645, ureg.kg / ureg.meters**3)
+CP = Q_(960, ureg.joules / (ureg.kg * ureg.degK))
+K_VALUE = Q_(1, ureg.watts / (ureg.meters * ureg.degK))
+
+IMPORT_BUDGETS = {'calc_functions': 600, 'scenarios': 650, 'main': 700, 'plots': 600, 'inverse_design': 650}
+
+
+def time_call(func=None, repeat=3, **kwargs):
+    # Best wall-clock time of repeat calls, in seconds
+    best = np.inf
+    for _ in range(repeat):
+        start = _time.perf_counter()
+        func(**kwargs)
+        best = min(best, _time.perf_counter() - start)
+    return best
+
+
+def bench_finite_difference(divisions=(3, 6, 12, 24, 48), durations=(10, 60), method='explicit', repeat=3):
+    # Node-update throughput of calc_finite_difference for dx = thickness/n and each simulated duration
+    results = []
+    biot = cf.calc_biot(h_value=H_AIR, k_value=K_VALUE, thickness=THICKNESS)
+    for n in divisions:
+        dx = THICKNESS / n
+        dt = cf.stability_analysis(h_value=H_AIR, k_value=K_VALUE, thickness=THICKNESS, rho=RHO, cp=CP, dx=dx)
+        fo = cf.calc_fo(k_value=K_VALUE, rho=RHO, cp=CP, delta_t=dt, delta_x=dx)
+        rows, cols = cf._grid_shape(thickness=THICKNESS, width=WIDTH, dx=dx)
+        for duration in durations:
+            time = Q_(duration, ureg.seconds)
+            steps = int(time.m_as(ureg.seconds) / dt.m_as(ureg.seconds))
+            seconds = time_call(cf.calc_finite_difference, repeat=repeat, fo=fo, biot=biot, T_i=T_I, flux=FLUX,
+                                k_value=K_VALUE, thickness=THICKNESS, width=WIDTH, T_amb=T_AMB, dx=dx, time=time,
+                                dt=dt, T_s=T_S, method=method)
+            results.append({'name': 'finite_difference/{}/n={}/t={}s'.format(method, n, duration),
+                            'rows': rows, 'cols': cols, 'steps': steps, 'seconds': seconds,
+                            'throughput': rows * cols * steps / seconds, 'throughput_units': 'node updates/s'})
+    return results
+
+
+def _closed_form_calls(batch_size=1):
+    # name -> (function, kwargs) for the closed-form functions, with pint inputs and plain SI floats.
+    # batch_size > 1 passes arrays of h values, and of dt to calc_fo, which takes no h.
+    scale = np.linspace(0.5, 1.5, batch_size) if batch_size > 1 else 1.
+    h_si = H_AIR.m_as(cf.H_UNITS) * scale
+    h_pint = Q_(h_si, cf.H_UNITS)
+    dt_si = 0.1 * scale
+    si = dict(k_value=K_VALUE.m_as(cf.K_UNITS), thickness=THICKNESS.m_as(cf.LENGTH_UNITS),
+              rho=RHO.m_as(cf.RHO_UNITS), cp=CP.m_as(cf.CP_UNITS), dx=THICKNESS.m_as(cf.LENGTH_UNITS) / 3,
+              width=WIDTH.m_as(cf.LENGTH_UNITS), flux=FLUX.m_as(cf.FLUX_UNITS), T_amb=T_AMB.m_as(cf.TEMP_UNITS),
+              T_i=T_I.m_as(cf.TEMP_UNITS), T_s=T_S.m_as(cf.TEMP_UNITS))
+    pint = dict(k_value=K_VALUE, thickness=THICKNESS, rho=RHO, cp=CP, dx=THICKNESS / 3, width=WIDTH, flux=FLUX,
+                T_amb=T_AMB, T_i=T_I, T_s=T_S)
+    calls = {}
+    for units, p, h, check in (('pint', pint, h_pint, True), ('float', si, h_si, False)):
+        calls['calc_biot/' + units] = (cf.calc_biot, dict(h_value=h, k_value=p['k_value'], thickness=p['thickness'],
+                                                          check_units=check))
+        calls['stability_analysis/' + units] = (cf.stability_analysis, dict(
+            h_value=h, k_value=p['k_value'], thickness=p['thickness'], rho=p['rho'], cp=p['cp'], dx=p['dx'],
+            check_units=check))
+        calls['calc_fo/' + units] = (cf.calc_fo, dict(k_value=p['k_value'], rho=p['rho'], cp=p['cp'],
+                                                      delta_t=Q_(dt_si, ureg.seconds) if check else dt_si,
+                                                      delta_x=p['dx'], check_units=check))
+        calls['calc_lumped_capacitance/' + units] = (cf.calc_lumped_capacitance, dict(
+            T_amb=p['T_amb'], T_i=p['T_i'], h_value=h, rho=p['rho'], thickness=p['thickness'], width=p['width'],
+            cp=p['cp'], flux=p['flux'], T_final=p['T_s'], check_units=check))
+
+    # The checked pint paths of these use Python min/log and take scalars only
+    if batch_size > 1:
+        del calls['stability_analysis/pint'], calls['calc_lumped_capacitance/pint']
+    return calls
+
+
+def bench_closed_form(batch_sizes=(1, 10000), repeat=3, number=200):
+    # Closed-form evaluations per second, single-call and batched, with and without pint
+    results = []
+    for batch_size in batch_sizes:
+        for name, (func, kwargs) in _closed_form_calls(batch_size=batch_size).items():
+            # Low h values cannot reach T_s, which gives NaN times
+            with np.errstate(invalid='ignore'):
+                seconds = time_call(lambda: [func(**kwargs) for _ in range(number)], repeat=repeat) / number
+            results.append({'name': '{}/batch={}'.format(name, batch_size), 'seconds': seconds,
+                            'throughput': batch_size / seconds, 'throughput_units': 'evaluations/s'})
+
+    # Whole-table sweep of every closed-form result
+    materials = {'Ceramic': dict(rho=RHO, cp=CP, k_value=K_VALUE)}
+    h_values = Q_(np.linspace(5, 30, 100), cf.H_UNITS)
+    fluxes = Q_(np.linspace(1000, 8000, 100), cf.FLUX_UNITS)
+    seconds = time_call(cf.calc_closed_form_sweep, repeat=repeat, materials=materials, h_value=h_values,
+                        flux=fluxes, thickness=THICKNESS, width=WIDTH, T_amb=T_AMB, T_i=T_I, T_final=T_S)
+    results.append({'name': 'calc_closed_form_sweep/batch={}'.format(h_values.size * fluxes.size),
+                    'seconds': seconds, 'throughput': h_values.size * fluxes.size / seconds,
+                    'throughput_units': 'designs/s'})
+    return results
+
+
+def run_benchmarks(quick=False):
+    if quick:
+        fd = bench_finite_difference(divisions=(3, 6, 12), durations=(60,), repeat=1)
+        closed_form = bench_closed_form(batch_sizes=(1, 1000), repeat=1, number=20)
+    else:
+        fd = bench_finite_difference()
+        closed_form = bench_closed_form()
+    return {'meta': {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+                     'quick': quick},
+            'results': fd + closed_form}
+
+
+def import_time(module=None, repeat=3):
+    # Best cumulative import time of module in a fresh interpreter, in milliseconds
+    best = np.inf
+    for _ in range(repeat):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                capture_output=True, text=True, check=True).stderr
+        for line in stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module and fields[2].startswith(' ' + module):
+                best = min(best, int(fields[1]) / 1000)
+    return best
+
+
+def check_import_budget(budgets=None, repeat=3):
+    """
+    Time each module import against its budget (IMPORT_BUDGETS by default). Returns (module, budget,
+    measured) for every module over budget.
+    """
+    budgets = IMPORT_BUDGETS if budgets is None else budgets
+    over = []
+    for module, budget in budgets.items():
+        measured = import_time(module=module, repeat=repeat)
+        print("import {:<20} {:>8.1f} ms (budget {} ms)".format(module, measured, budget))
+        if measured > budget:
+            over.append((module, budget, measured))
+    return over
+
+
+def compare(results=None, baseline=None, tolerance=0.2):
+    """
+    Compare throughput against a baseline run. Returns (name, baseline, new, ratio) for every
+    benchmark whose throughput dropped by more than tolerance (a fraction).
+    """
+    base = {r['name']: r['throughput'] for r in baseline['results']}
+    regressions = []
+    for r in results['results']:
+        if r['name'] in base:
+            ratio = r['throughput'] / base[r['name']]
+            if ratio < 1 - tolerance:
+                regressions.append((r['name'], base[r['name']], r['throughput'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plancha solver benchmarks')
+    parser.add_argument('--output', default='benchmarks.json', help='where to save the JSON results')
+    parser.add_argument('--baseline', default=None, help='previous results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional throughput drop before a regression is reported')
+    parser.add_argument('--quick', action='store_true', help='smaller grids and fewer repeats')
+    parser.add_argument('--import-budget', action='store_true',
+                        help='only check module import times against IMPORT_BUDGETS')
+    args = parser.parse_args()
+
+    if args.import_budget:
+        over = check_import_budget()
+        for module, budget, measured in over:
+            print("OVER BUDGET {}: {:.1f} ms > {} ms".format(module, measured, budget))
+        sys.exit(1 if over else 0)
+
+    results = run_benchmarks(quick=args.quick)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for r in results['results']:
+        print("{:<60} {:>12.3e} {}".format(r['name'], r['throughput'], r['throughput_units']))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results=results, baseline=json.load(f), tolerance=args.tolerance)
+        for name, old, new, ratio in regressions:
+            print("REGRESSION {}: {:.3e} -> {:.3e} ({:.0%})".format(name, old, new, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
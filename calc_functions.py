@@ -3,60 +3,210 @@ Calculations:
 """
 
 from __init__ import ureg, Q_
+from collections import deque
+from functools import lru_cache
+from time import perf_counter
 from math import log, e
 import numpy as np
+from recorders import ProbeRecorder, load_checkpoint, unfold_symmetric
+from materials import property_table
 
+FD_METHODS = ('explicit', 'backward_euler', 'crank_nicolson')
+STEADY_SOLVERS = ('direct', 'iterative')
+CROSSING_INTERPOLATIONS = ('linear', 'cubic')
 
-def calc_biot(h_value=None, k_value=None, thickness=None):
-    L_c = thickness
-    biot = h_value * L_c / k_value
-    return biot
+# Part of every result cache key (result_cache.py). Bump it whenever a change alters numerical results,
+# so cached results from older code are not reused.
+SOLVER_VERSION = '3'
 
+# SI units used by the unit-stripped float64 core. Inputs are converted to these magnitudes once on
+# entry to each public function and the result is wrapped in a Quantity once on exit. Plain floats or
+# arrays passed in are assumed to already be in these units. Unit strings are parsed on use, so importing
+# this module does not build the unit registry.
+LENGTH_UNITS = 'meter'
+TIME_UNITS = 'second'
+TEMP_UNITS = 'kelvin'
+H_UNITS = 'watt / meter ** 2 / kelvin'
+K_UNITS = 'watt / meter / kelvin'
+RHO_UNITS = 'kilogram / meter ** 3'
+CP_UNITS = 'joule / kilogram / kelvin'
+FLUX_UNITS = 'watt / meter ** 2'
 
-def stability_analysis(h_value=None, k_value=None, thickness=None, rho=None, cp=None, dx=None):
+
+# Quantities converted by to_si, read by the instrumentation. Only the Quantity branch counts, so the
+# float64 hot path pays nothing for it.
+_COUNTERS = {'unit_conversions': 0}
+
+
+# Float64 core. These take and return plain floats or arrays in the units above, broadcast over array
+# inputs and never touch pint, so callers that have already stripped units (inverse_design.py) can use
+# them in tight loops. The calc_* functions below wrap them with unit handling.
+
+def to_si(value, units):
+    # Strip units at the API boundary
+    if isinstance(value, ureg.Quantity):
+        _COUNTERS['unit_conversions'] += 1
+        return value.m_as(units)
+    return value
+
+
+def biot_number(h_value, k_value, thickness):
+    return h_value * thickness / k_value
+
+
+def stable_dt(h_value, k_value, thickness, rho, cp, dx):
+    # dt3 alone keeps every c_self of _build_stencil non-negative, because the plate Biot number used
+    # here is never below the cell Biot number h*dx/k of the node equations
     biot = h_value * thickness / k_value
     alpha = k_value / (rho * cp)
 
     # Stability equations for each node
-    dt1 = (2 * dx**2 / (alpha * (2 + biot))).to(ureg.seconds)
-    dt2 = (dx**2 / (alpha * 2 * (2 + biot))).to(ureg.seconds)
-    dt3 = (dx**2 / (alpha * 4 * (1 + biot))).to(ureg.seconds)
-    dt4 = (dx**2 / (alpha * 3)).to(ureg.seconds)
-    dt5 = (dx**2 / (alpha * 4)).to(ureg.seconds)
-
-    value_list = [dt1, dt2, dt3, dt4, dt5]
+    dt1 = 2 * dx**2 / (alpha * (2 + biot))
+    dt2 = dx**2 / (alpha * 2 * (2 + biot))
+    dt3 = dx**2 / (alpha * 4 * (1 + biot))
+    dt4 = dx**2 / (alpha * 3)
+    dt5 = dx**2 / (alpha * 4)
 
     # Return the minimum value
-    min_dt = min(value_list)
-    return min_dt
+    return np.min(np.broadcast_arrays(dt1, dt2, dt3, dt4, dt5), axis=0)
 
 
-def calc_fo(k_value=None, rho=None, cp=None, delta_t=None, delta_x=None):
+def fourier_number(k_value, rho, cp, delta_t, delta_x):
     alpha = k_value / (rho * cp)
-    fo = (alpha * delta_t / (delta_x ** 2)).to('dimensionless')
-    return fo
+    return alpha * delta_t / (delta_x ** 2)
+
+
+def lumped_coefficients(h_value, rho, thickness, cp, flux):
+    # Lumped ODE dT/dt = -a (T - T_amb) + b, per unit width of the top surface
+    a = h_value / (rho * thickness * cp)
+    b = flux / (rho * thickness * cp)
+    return a, b
+
+
+def lumped_time(a, b, T_amb, T_i, T_final):
+    return np.log((T_final - T_amb - (b / a)) / (T_i - T_amb - (b / a))) * (-1 / a)
+
+
+def lumped_temp(a, b, T_amb, T_i, time):
+    return (T_i - T_amb - b/a) * np.exp(-a * time) + (b / a) + T_amb
+
+
+def _convection_heat_loss(h_value, thickness, width, T_amb, T_plancha):
+    # Top surface plus both sides, per unit length
+    return h_value * (width + 2 * thickness) * (T_plancha - T_amb)
+
+
+def calc_biot(h_value=None, k_value=None, thickness=None, check_units=False):
+    if check_units:
+        L_c = thickness
+        biot = h_value * L_c / k_value
+        return biot
+    biot = biot_number(to_si(h_value, H_UNITS), to_si(k_value, K_UNITS), to_si(thickness, LENGTH_UNITS))
+    return Q_(biot, ureg.dimensionless)
+
+
+def stability_analysis(h_value=None, k_value=None, thickness=None, rho=None, cp=None, dx=None, check_units=False):
+    if check_units:
+        biot = h_value * thickness / k_value
+        alpha = k_value / (rho * cp)
+
+        # Stability equations for each node
+        dt1 = (2 * dx**2 / (alpha * (2 + biot))).to(ureg.seconds)
+        dt2 = (dx**2 / (alpha * 2 * (2 + biot))).to(ureg.seconds)
+        dt3 = (dx**2 / (alpha * 4 * (1 + biot))).to(ureg.seconds)
+        dt4 = (dx**2 / (alpha * 3)).to(ureg.seconds)
+        dt5 = (dx**2 / (alpha * 4)).to(ureg.seconds)
+
+        value_list = [dt1, dt2, dt3, dt4, dt5]
+
+        # Return the minimum value
+        min_dt = min(value_list)
+        return min_dt
+    min_dt = stable_dt(to_si(h_value, H_UNITS), to_si(k_value, K_UNITS), to_si(thickness, LENGTH_UNITS),
+                       to_si(rho, RHO_UNITS), to_si(cp, CP_UNITS), to_si(dx, LENGTH_UNITS))
+    return Q_(min_dt, TIME_UNITS)
+
+
+def calc_fo(k_value=None, rho=None, cp=None, delta_t=None, delta_x=None, check_units=False):
+    if check_units:
+        alpha = k_value / (rho * cp)
+        fo = (alpha * delta_t / (delta_x ** 2)).to('dimensionless')
+        return fo
+    fo = fourier_number(to_si(k_value, K_UNITS), to_si(rho, RHO_UNITS), to_si(cp, CP_UNITS), to_si(delta_t, TIME_UNITS),
+             to_si(delta_x, LENGTH_UNITS))
+    return Q_(fo, ureg.dimensionless)
 
 
 def calc_lumped_capacitance(T_amb=None, T_i=None, h_value=None, rho=None, thickness=None, width=None, cp=None,
-                            flux=None, T_final=None, time=None):
+                            flux=None, T_final=None, time=None, check_units=False):
     """
     This function finds the time required to reach T_final OR the temperature at the given time value.
     Assumes no energy generation. Surface area is the top surface of the plancha only.
+    time or T_final may be arrays, giving the whole curve in one evaluation (see calc_lumped_curve).
+    Set check_units=True to run every step on pint quantities instead of the float64 core (scalars only).
     """
-    a = ((h_value * width) / (rho * thickness * width * cp)).to(1 / ureg.seconds)
-    b = ((flux * width) / (rho * thickness * width * cp)).to(ureg.degK / ureg.seconds)
+    if check_units:
+        a = ((h_value * width) / (rho * thickness * width * cp)).to(1 / ureg.seconds)
+        b = ((flux * width) / (rho * thickness * width * cp)).to(ureg.degK / ureg.seconds)
+        if time is None:
+            # Solve for time
+            t = (log((T_final - T_amb - (b / a)) / (T_i - T_amb - (b / a))) * (-1 / a)).to(ureg.seconds)
+            return t
+        elif T_final is None:
+            # Solve for T_final
+            temp = ((T_i - T_amb - b/a) * e**(-a * time) + (b / a) + T_amb).to(ureg.degK)
+            return temp
+        else:
+            return Exception("Error in calc_lumped_capacitance function")
+
+    a, b = lumped_coefficients(to_si(h_value, H_UNITS), to_si(rho, RHO_UNITS), to_si(thickness, LENGTH_UNITS),
+                                to_si(cp, CP_UNITS), to_si(flux, FLUX_UNITS))
+    T_amb = to_si(T_amb, TEMP_UNITS)
+    T_i = to_si(T_i, TEMP_UNITS)
     if time is None:
         # Solve for time
-        t = (log((T_final - T_amb - (b / a)) / (T_i - T_amb - (b / a))) * (-1 / a)).to(ureg.seconds)
-        return t
+        t = lumped_time(a, b, T_amb, T_i, to_si(T_final, TEMP_UNITS))
+        return Q_(t, TIME_UNITS)
     elif T_final is None:
         # Solve for T_final
-        temp = ((T_i - T_amb - b/a) * e**(-a * time) + (b / a) + T_amb).to(ureg.degK)
-        return temp
+        temp = lumped_temp(a, b, T_amb, T_i, to_si(time, TIME_UNITS))
+        return Q_(temp, TEMP_UNITS)
     else:
         return Exception("Error in calc_lumped_capacitance function")
 
 
+def _adaptive_lumped_times(a, t_end, n_points):
+    # Sample times that equidistribute the linear interpolation error of T = C exp(-a t) + D. The error
+    # over a step h is about h**2 |T''| / 8, so steps are equal in the integral of sqrt|T''| ~ exp(-a t / 2).
+    u = np.linspace(0., 1., n_points)
+    times = -2 / a[..., None] * np.log1p(u * np.expm1(-0.5 * a * t_end)[..., None])
+    # Pin the end to t_end exactly, free of rounding in the inversion
+    times[..., -1] = t_end
+    return times
+
+
+def calc_lumped_curve(T_amb=None, T_i=None, h_value=None, rho=None, thickness=None, cp=None, flux=None,
+                      time=None, t_end=None, n_points=200):
+    """
+    Lumped capacitance temperature curves in one NumPy evaluation. The inputs may be scalars or arrays
+    (e.g. one entry per material) that broadcast to the shape S of the set of curves.
+
+    If time is given, it is a 1-D array of times shared by every curve, and the temperatures at those
+    times are returned with shape S + (len(time),). Otherwise each curve is sampled at n_points times
+    from 0 to t_end, placed closely where the curve bends and sparsely where it is nearly straight, so
+    that linear interpolation between samples has the same error everywhere. Then the times and
+    temperatures are both returned with shape S + (n_points,).
+    """
+    a, b = lumped_coefficients(to_si(h_value, H_UNITS), to_si(rho, RHO_UNITS), to_si(thickness, LENGTH_UNITS),
+                                to_si(cp, CP_UNITS), to_si(flux, FLUX_UNITS))
+    a, b, T_amb, T_i = (np.asarray(arr, dtype=float)[..., None] for arr in np.broadcast_arrays(
+        a, b, to_si(T_amb, TEMP_UNITS), to_si(T_i, TEMP_UNITS)))
+    if time is not None:
+        return Q_(lumped_temp(a, b, T_amb, T_i, np.asarray(to_si(time, TIME_UNITS), dtype=float)), TEMP_UNITS)
+    times = _adaptive_lumped_times(a[..., 0], np.asarray(to_si(t_end, TIME_UNITS), dtype=float), n_points)
+    return Q_(times, TIME_UNITS), Q_(lumped_temp(a, b, T_amb, T_i, times), TEMP_UNITS)
+
+
 def calc_stored_energy_per_time(rho=None, thickness=None, width=None, cp=None, T_i=None, T_final=None, time=None):
     # Calc energy stored at operating temp. Requires input for time to reach operating temp.
     energy_stored_per_length_per_time = rho * width * thickness * cp * (T_final - T_i) / time
@@ -79,73 +229,754 @@ def calc_steady_state_temp(flux=None, h_value=None, thickness=None, width=None,
     return T_ss
 
 
+def calc_closed_form_sweep(materials=None, h_value=None, flux=None, thickness=None, width=None, T_amb=None,
+                           T_i=None, T_final=None, time=None):
+    """
+    Evaluate the closed-form (lumped) results for every combination of material, h_value, flux,
+    thickness and width in one broadcast NumPy pass.
+
+    materials maps a name to a dict with 'rho', 'cp' and 'k_value'. h_value, flux, thickness and width
+    may each be a scalar or an array. T_final is the operating temperature. If time is given, the
+    lumped temperature at that time is also reported.
+
+    Returns a structured array with one row per design. All values are in SI units (m, s, K, W, J):
+        material, h_value, flux, thickness, width, biot, time_to_T_final, temp_at_time,
+        energy_stored (J/m), conv_loss_at_T_final (W/m), T_steady, flux_for_T_final (W/m)
+    """
+    names = list(materials)
+    props = np.array([[to_si(m['rho'], RHO_UNITS), to_si(m['cp'], CP_UNITS), to_si(m['k_value'], K_UNITS)]
+                      for m in materials.values()], dtype=float)
+
+    # Full design grid, flattened to one row per combination
+    grids = np.meshgrid(np.arange(len(names)), np.atleast_1d(to_si(h_value, H_UNITS)),
+                        np.atleast_1d(to_si(flux, FLUX_UNITS)), np.atleast_1d(to_si(thickness, LENGTH_UNITS)),
+                        np.atleast_1d(to_si(width, LENGTH_UNITS)), indexing='ij')
+    mat_idx, h, q, L, w = (grid.ravel() for grid in grids)
+    rho, cp, k = props[mat_idx].T
+    T_amb = to_si(T_amb, TEMP_UNITS)
+    T_i = to_si(T_i, TEMP_UNITS)
+    T_final = to_si(T_final, TEMP_UNITS)
+
+    table = np.zeros(mat_idx.size, dtype=[('material', 'U{}'.format(max(len(n) for n in names))),
+                                           ('h_value', float), ('flux', float), ('thickness', float),
+                                           ('width', float), ('biot', float), ('time_to_T_final', float),
+                                           ('temp_at_time', float), ('energy_stored', float),
+                                           ('conv_loss_at_T_final', float), ('T_steady', float),
+                                           ('flux_for_T_final', float)])
+    table['material'] = np.array(names)[mat_idx]
+    table['h_value'], table['flux'], table['thickness'], table['width'] = h, q, L, w
+    table['biot'] = biot_number(h, k, L)
+
+    # Unreachable targets give NaN times rather than warnings
+    a, b = lumped_coefficients(h, rho, L, cp, q)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['time_to_T_final'] = lumped_time(a, b, T_amb, T_i, T_final)
+    table['temp_at_time'] = np.nan if time is None else lumped_temp(a, b, T_amb, T_i, to_si(time, TIME_UNITS))
+    table['energy_stored'] = rho * w * L * cp * (T_final - T_i)
+    table['conv_loss_at_T_final'] = _convection_heat_loss(h, L, w, T_amb, T_final)
+    table['T_steady'] = T_amb + (q * w) / (h * (2 * L + w))
+    table['flux_for_T_final'] = table['conv_loss_at_T_final']
+    return table
+
+
+def _grid_shape(thickness=None, width=None, dx=None):
+    """
+    Number of node rows and columns for the cross-section: thickness/dx by width/dx. The ratios are
+    rounded rather than truncated, so dx = thickness/n gives exactly n rows even when the division is
+    not exact in floating point.
+    """
+    dx = to_si(dx, LENGTH_UNITS)
+    rows = int(round(to_si(thickness, LENGTH_UNITS) / dx))
+    cols = int(round(to_si(width, LENGTH_UNITS) / dx))
+    if rows < 2 or cols < 2:
+        raise ValueError("dx must give at least 2 x 2 nodes, got {} x {}".format(rows, cols))
+    return rows, cols
+
+
+def _face_biot(cell_biot):
+    # Biot number of a convective face seen from its cell center: half a cell of conduction in series
+    # with the convection, h_eff = h / (1 + h*dx/(2k))
+    return cell_biot / (1 + cell_biot / 2)
+
+
+def _top_surface_temp(temp, T_amb, cell_biot):
+    # Top surface temperature of top row cells from their center values, dx/2 below the surface:
+    # 2k/dx (T - T_surface) = h (T_surface - T_amb)
+    return (temp + cell_biot / 2 * T_amb) / (1 + cell_biot / 2)
+
+
+def _set_nodes(coeffs, idx, c_self=0., c_left=0., c_right=0., c_down=0., c_up=0., c_amb=0., c_flux=0.):
+    # Overwrite every coefficient for the node(s) selected by idx
+    for arr, value in zip(coeffs, (c_self, c_left, c_right, c_down, c_up, c_amb, c_flux)):
+        arr[idx] = value
+
+
+def _build_stencil(fo=None, biot=None, rows=None, cols=None, symmetric=False):
+    """
+    Build coefficient arrays for the explicit node equations on a (rows, cols) grid. Row 0 is the
+    bottom (heated) surface. The p+1 value of every node is
+
+        c_self*T + c_left*T[j-1] + c_right*T[j+1] + c_down*T[i-1] + c_up*T[i+1] + c_amb*T_amb + c_flux*flux*dx/k
+
+    Each node is the center of a dx by dx cell, so rows*dx is the thickness and cols*dx the width. The
+    equations are an energy balance on the cell: conduction through faces shared with neighbours,
+    convection through top and side faces, and flux*dx into bottom faces. Convection h*dx*(T_amb - T_face)
+    is taken from the face temperature, half a cell from the node, so the node sees the face Biot number
+    Bi/(1 + Bi/2) of the cell Biot number Bi = h*dx/k = biot/rows. Each conduction term enters the two
+    cells sharing the face with equal weight and opposite sign, so no heat is created or lost inside the
+    plate. At steady state the convection loss equals flux * width.
+
+    biot is the plate Biot number h*thickness/k (calc_biot). Node types are assigned from lowest to
+    highest precedence so that corners win over edges.
+
+    With symmetric=True only the left (cols + 1) // 2 columns are returned, with an adiabatic symmetry
+    boundary at the vertical centerline: the right neighbour of the last column is its mirror image.
+    """
+    fo = to_si(fo, ureg.dimensionless)
+    biot = _face_biot(to_si(biot, ureg.dimensionless) / rows)
+    coeffs = np.zeros(shape=[7, rows, cols])
+
+    _set_nodes(coeffs, np.s_[:, :], c_self=1 - 4 * fo, c_left=fo, c_right=fo, c_down=fo, c_up=fo)    # Interior
+    _set_nodes(coeffs, np.s_[:, cols-1], c_self=1 - 3 * fo - biot * fo, c_left=fo, c_down=fo, c_up=fo,
+               c_amb=biot * fo)    # Right
+    _set_nodes(coeffs, np.s_[:, 0], c_self=1 - 3 * fo - biot * fo, c_right=fo, c_down=fo, c_up=fo,
+               c_amb=biot * fo)    # Left
+    _set_nodes(coeffs, np.s_[rows-1, :], c_self=1 - 3 * fo - biot * fo, c_left=fo, c_right=fo, c_down=fo,
+               c_amb=biot * fo)    # Top
+    _set_nodes(coeffs, np.s_[rows-1, cols-1], c_self=1 - 2 * fo - 2 * biot * fo, c_left=fo, c_down=fo,
+               c_amb=2 * biot * fo)    # TRC
+    _set_nodes(coeffs, np.s_[rows-1, 0], c_self=1 - 2 * fo - 2 * biot * fo, c_right=fo, c_down=fo,
+               c_amb=2 * biot * fo)    # TLC
+    _set_nodes(coeffs, np.s_[0, :], c_self=1 - 3 * fo, c_left=fo, c_right=fo, c_up=fo,
+               c_flux=fo)    # Bottom
+    _set_nodes(coeffs, np.s_[0, cols-1], c_self=1 - 2 * fo - biot * fo, c_left=fo, c_up=fo,
+               c_amb=biot * fo, c_flux=fo)    # BRC
+    _set_nodes(coeffs, np.s_[0, 0], c_self=1 - 2 * fo - biot * fo, c_right=fo, c_up=fo,
+               c_amb=biot * fo, c_flux=fo)    # BLC
+
+    if symmetric:
+        coeffs = coeffs[:, :, :(cols + 1) // 2].copy()
+        c_self, c_left, c_right = coeffs[:3]
+        if cols % 2:
+            c_left[:, -1] += c_right[:, -1]     # Axis on a node column: T[j+1] mirrors T[j-1]
+        else:
+            c_self[:, -1] += c_right[:, -1]     # Axis between columns: T[j+1] mirrors T[j]
+        c_right[:, -1] = 0.
+    return coeffs
+
+
+def _explicit_step(temp, out, stencil):
+    # Whole-grid explicit update of temp into out. Neighbour terms only touch the slices where
+    # that neighbour exists, so edges need no padding. Any leading (batch) axes are carried along.
+    c_self, source, c_left, c_right, c_down, c_up = stencil
+    out[...] = c_self * temp + source
+    out[..., :, 1:] += c_left * temp[..., :, :-1]
+    out[..., :, :-1] += c_right * temp[..., :, 1:]
+    out[..., 1:, :] += c_down * temp[..., :-1, :]
+    out[..., :-1, :] += c_up * temp[..., 1:, :]
+    return out
+
+
+def _variable_stencil(structure, table, temp, h_value, dx, dt, T_amb, flux):
+    # Pre-sliced explicit stencil from the properties at every node's current temperature. Each face
+    # conducts with the harmonic mean k of the two nodes it joins, and each node scales the heat through
+    # its faces by g = dt/(rho*cp*dx^2) = fo/k, so conduction between two nodes is equal and opposite.
+    faces, n_amb = structure
+    _, n_left, n_right, n_down, n_up, _, n_flux = faces
+    k_value = table.lookup(table.k_value, temp)
+    g = table.lookup(table.alpha, temp) * dt / dx**2 / k_value
+    k_cols = 2 * k_value[:, :-1] * k_value[:, 1:] / (k_value[:, :-1] + k_value[:, 1:])    # Faces between columns
+    k_rows = 2 * k_value[:-1, :] * k_value[1:, :] / (k_value[:-1, :] + k_value[1:, :])    # Faces between rows
+    c_left = g[:, 1:] * k_cols * n_left[:, 1:]
+    c_right = g[:, :-1] * k_cols * n_right[:, :-1]
+    c_down = g[1:, :] * k_rows * n_down[1:, :]
+    c_up = g[:-1, :] * k_rows * n_up[:-1, :]
+    c_amb = g * k_value * _face_biot(h_value * dx / k_value) * n_amb
+    c_self = 1 - c_amb
+    c_self[:, 1:] -= c_left
+    c_self[:, :-1] -= c_right
+    c_self[1:, :] -= c_down
+    c_self[:-1, :] -= c_up
+    source = c_amb * T_amb + g * dx * flux * n_flux
+    return c_self, source, c_left, c_right, c_down, c_up
+
+
+def _stencil_operator(c_self, c_left, c_right, c_down, c_up):
+    # Sparse form of the explicit update with the identity removed, so that T_p+1 = T + L T + source
+    from scipy import sparse
+    rows, cols = c_self.shape
+    n = np.arange(rows * cols).reshape(rows, cols)
+    data = [c_self.ravel() - 1, c_left[:, 1:].ravel(), c_right[:, :-1].ravel(), c_down[1:, :].ravel(),
+            c_up[:-1, :].ravel()]
+    row_idx = [n.ravel(), n[:, 1:].ravel(), n[:, :-1].ravel(), n[1:, :].ravel(), n[:-1, :].ravel()]
+    col_idx = [n.ravel(), n[:, :-1].ravel(), n[:, 1:].ravel(), n[:-1, :].ravel(), n[1:, :].ravel()]
+    return sparse.csc_matrix((np.concatenate(data), (np.concatenate(row_idx), np.concatenate(col_idx))),
+                             shape=(rows * cols, rows * cols))
+
+
+@lru_cache(maxsize=32)
+def _implicit_factorization(fo, biot, rows, cols, method, symmetric=False):
+    """
+    Factorize the implicit system for one (fo, biot, grid) combination, i.e. once per material, dx, dt
+    and h. Repeated runs with the same inputs reuse the cached LU factors.
+
+    backward_euler:  (I - L) T_p+1 = T_p + source
+    crank_nicolson:  (I - L/2) T_p+1 = (I + L/2) T_p + source
+    """
+    # scipy is only needed by the implicit and steady solvers, so it is imported on first use
+    from scipy import sparse
+    from scipy.sparse.linalg import splu
+    c_self, c_left, c_right, c_down, c_up = _build_stencil(fo=fo, biot=biot, rows=rows, cols=cols,
+                                                           symmetric=symmetric)[:5]
+    L = _stencil_operator(c_self, c_left, c_right, c_down, c_up)
+    eye = sparse.identity(c_self.size, format='csc')
+    if method == 'backward_euler':
+        return splu(eye - L), None
+    elif method == 'crank_nicolson':
+        return splu(eye - 0.5 * L), (eye + 0.5 * L).tocsr()
+    else:
+        raise ValueError("Unknown implicit method '{}'".format(method))
+
+
+def _implicit_step(temp, out, lu, rhs_operator, source):
+    # One implicit step of temp into out using the cached factorization
+    rhs = temp.ravel() if rhs_operator is None else rhs_operator @ temp.ravel()
+    out[...] = lu.solve(rhs + source.ravel()).reshape(out.shape)
+    return out
+
+
+def _crossing_time(times, values, threshold, interpolation='linear'):
+    """
+    Time at which a probe reached threshold between its last two samples. times and values hold up to
+    the last four samples, oldest first. 'cubic' fits a cubic through four samples and falls back to
+    linear interpolation when fewer samples exist or no root lies in the last interval.
+    """
+    t0, t1 = times[-2], times[-1]
+    v0, v1 = values[-2], values[-1]
+    if interpolation == 'cubic' and len(times) == 4:
+        poly = np.polyfit(np.asarray(times) - t0, values, 3)
+        poly[-1] -= threshold
+        roots = np.roots(poly)
+        roots = roots[np.isreal(roots)].real + t0
+        roots = roots[(roots >= t0) & (roots <= t1)]
+        if roots.size:
+            return roots.min()
+    return t0 + (t1 - t0) * (threshold - v0) / (v1 - v0)
+
+
+def _checkpoint_state(step, recorded, dt, temp_arr, crossing_times, recent_times, recent_temps, recorder,
+                      probe_rows, probe_cols, thresholds):
+    # Everything needed to continue the march at step. recorded is True if step was already recorded.
+    return dict(step=step, time=step * dt, recorded=recorded, dt=dt, field=to_si(temp_arr, TEMP_UNITS),
+                crossing_times=crossing_times, recent_times=np.array(recent_times),
+                recent_temps=np.array(recent_temps).reshape(-1, probe_rows.size), probe_rows=probe_rows,
+                probe_cols=probe_cols, thresholds=thresholds, **recorder.state())
+
+
 def calc_finite_difference(fo=None, biot=None, T_i=None, flux=None, k_value=None, thickness=None,
-                           width=None, T_amb=None, dx=None, time=Q_(3100, ureg.seconds), dt=None, T_s=None):
-    # Find time to reach T_s at center of plancha surface
-    temp_arr = np.full(shape=[3, 135], fill_value=T_i) * ureg.degK
-    new_temp_arr = np.full(shape=[3, 135], fill_value=T_i) * ureg.degK
+                           width=None, T_amb=None, dx=None, time=3100., dt=None, T_s=None,
+                           check_units=False, method='explicit', probes=None, stop_at_target=False,
+                           interpolation='linear', recorder=None, snapshots=None, symmetric=False,
+                           material=None, h_value=None, instrument=None, checkpoint=None, resume=None):
+    """
+    Find time to reach T_s at center of plancha surface. The march runs on plain float64 arrays in
+    kelvin unless check_units is set, in which case the same update runs on pint arrays.
+
+    method selects the time integration: 'explicit' (dt limited by stability_analysis), or the
+    unconditionally stable 'backward_euler' and 'crank_nicolson', where dt can be chosen for accuracy.
+    fo must be calculated with the same dt.
+
+    The first time each probe node reaches each T_s value is found by 'linear' or 'cubic' interpolation
+    between steps. probes is a list of (row, col) nodes (default: top center) and T_s may be a single
+    temperature or an array of them. Nodes are cell centers; probes in the top row report the top
+    surface temperature, extrapolated through half a cell of conduction and the convection to T_amb, as
+    does the returned top center temperature. The crossing times come back as an array of shape
+    (len(probes), len(T_s)), with axes dropped where probes is None or T_s is a scalar, and NaN for
+    targets not reached. With stop_at_target=True the march stops once every target has been reached.
+
+    The returned history comes from recorder, a recorders.ProbeRecorder (default: the probes every
+    step). With several probes the temperatures have shape (samples, probes). snapshots is an optional
+    recorders.SnapshotWriter that streams full fields to a memory-mapped .npy file.
 
-    plot_times_list = []
-    plot_temps_list = []
-    time_to_operating_temp = 0
+    symmetric=True solves only the left half of the width, with an adiabatic boundary at the vertical
+    centerline, for half the memory and work. Probes on the right half are mirrored and snapshots are
+    rebuilt to the full width only when written.
+
+    material names a temperature-dependent material from materials.MATERIALS. Then k, rho and cp are
+    looked up for every node from its current temperature each step, fo and biot are rebuilt from
+    h_value, and the fo, biot and k_value arguments are ignored. Conduction between two nodes uses the
+    harmonic mean of their k. This needs the explicit float64 path.
+    If dt is None it defaults to the stability limit over the material's whole table.
+
+    instrument is an optional instrumentation.Instrumentation. It receives per-phase wall-clock
+    timings and step/node-update/unit-conversion counters, and is called back every N steps with the
+    probe temperatures. A callback can stop the march early.
+
+    checkpoint is an optional recorders.Checkpointer that periodically saves the field, step, simulated
+    time, crossing state and recorder history, and saves once more when the march ends. resume is a
+    checkpoint path (or a dict from recorders.load_checkpoint) to continue from instead of T_i, with the
+    same grid, dt, probes and T_s. time may be longer than the original run, to extend it. The history
+    then covers the whole run; snapshots only cover the resumed part.
+    """
+    if method not in FD_METHODS:
+        raise ValueError("method must be one of {}".format(FD_METHODS))
+    if interpolation not in CROSSING_INTERPOLATIONS:
+        raise ValueError("interpolation must be one of {}".format(CROSSING_INTERPOLATIONS))
+    if check_units and method != 'explicit':
+        raise ValueError("check_units is only supported by the explicit method")
+
+    # Temperature-dependent properties come from a memoized dense lookup table
+    table = None
+    if material is not None:
+        if check_units or method != 'explicit':
+            raise ValueError("Temperature-dependent materials need method='explicit' and check_units=False")
+        table = property_table(material)
+        if dt is None:
+            dt = np.min(stable_dt(to_si(h_value, H_UNITS), table.k_value, to_si(thickness, LENGTH_UNITS),
+                                  table.rho, table.cp, to_si(dx, LENGTH_UNITS)))
 
     # Constants
-    rows = int(thickness.magnitude / dx.magnitude)
-    cols = int(width.magnitude / dx.magnitude)
-    times = int(time.magnitude / dt.magnitude)
-
-    for t in range(1, times):
-        # Calculate p+1 values
-        for i in range(rows):   # y-dir
-            for j in range(cols):   # x-dir
-                if j == 0 and i == 0:   # BLC
-                    new_temp_arr[i, j] = (fo / 2 * (temp_arr[i, j + 1] + temp_arr[i + 1, j] + biot * T_amb) +
-                                          (1 - fo - 0.5 * biot * fo) * temp_arr[i, j] + dx / k_value * fo * flux).to(ureg.degK)
-                elif j == cols-1 and i == 0:    # BRC
-                    new_temp_arr[i, j] = (fo / 2 * (temp_arr[i, j - 1] + temp_arr[i + 1, j] + biot * T_amb) +
-                                          (1 - fo - 0.5 * biot * fo) * temp_arr[i, j] + dx / k_value * fo * flux).to(ureg.degK)
-                elif 0 < j < cols-1 and i == 0:     # Bottom
-                    new_temp_arr[i, j] = (fo / 2 * (temp_arr[i, j + 1] + temp_arr[i, j - 1] + 4 * temp_arr[i + 1, j]) +
-                                          temp_arr[i, j] * (1 - 3 * fo) + dx / k_value * fo * flux).to(ureg.degK)
-                elif j == 0 and i == rows-1:    # TLC
-                    new_temp_arr[i, j] = (2 * fo * (temp_arr[i, j + 1] + temp_arr[i - 1, j] + 2 * biot * T_amb) +
-                                          (1 - 4 * fo - 4 * biot * fo) * temp_arr[i, j]).to(ureg.degK)
-                elif j == cols-1 and i == rows-1:   # TRC
-                    new_temp_arr[i, j] = (2 * fo * (temp_arr[i, j - 1] + temp_arr[i - 1, j] + 2 * biot * T_amb) +
-                                          (1 - 4 * fo - 4 * biot * fo) * temp_arr[i, j]).to(ureg.degK)
-                elif 0 < j < cols-1 and i == rows-1:    # Top
-                    new_temp_arr[i, j] = (fo * (temp_arr[i - 1, j] + temp_arr[i, j - 1] + temp_arr[i, j + 1] + 2 *
-                                                biot * T_amb) + (1 - 4 * fo - 2 * biot * fo) * temp_arr[i, j]).to(ureg.degK)
-                elif j == 0 and 0 < i < rows-1:     # Left
-                    new_temp_arr[i, j] = (fo * (2 * temp_arr[i, j + 1] + temp_arr[i + 1, j] + temp_arr[i - 1, j] +
-                                                2 * biot * T_amb) + (1 - 4 * fo - 2 * biot * fo) * temp_arr[i, j]).to(ureg.degK)
-                elif j == cols-1 and 0 < i < rows-1:   # Right
-                    new_temp_arr[i, j] = (fo * (2 * temp_arr[i, j - 1] + temp_arr[i + 1, j] + temp_arr[i - 1, j] +
-                                                2 * biot * T_amb) + (1 - 4 * fo - 2 * biot * fo) * temp_arr[i, j]).to(ureg.degK)
-                elif 0 < j < cols-1 and 0 < i < rows-1:   # Interior
-                    new_temp_arr[i, j] = (fo * (temp_arr[i, j + 1] + temp_arr[i, j - 1] + temp_arr[i + 1, j] +
-                                                temp_arr[i - 1, j]) + (1 - 4 * fo) * temp_arr[i, j]).to(ureg.degK)
-                else:
-                    Exception('Error in finite difference function')
-
-        # Save time and top center temp value
-        top_center_temp = temp_arr[rows-1, int(0.5*(cols-1))]
-        plot_temps_list.append(top_center_temp)
-        plot_time = t * dt
-        plot_times_list.append(plot_time)
-
-        # Check if operating temp has been reached
-        if top_center_temp >= T_s:
-            time_to_operating_temp = t * dt
-
-        # Move p+1 values to p array
-        for i in range(rows):
-            for j in range(cols):
-                temp_arr[i, j] = new_temp_arr[i, j]
-
-    top_center_temp = temp_arr[rows-1, int((cols-1)*0.5)]
+    rows, cols = _grid_shape(thickness=thickness, width=width, dx=dx)
+    times = int(to_si(time, TIME_UNITS) / to_si(dt, TIME_UNITS))
+    center = int(0.5*(cols-1))
+    dt_s = to_si(dt, TIME_UNITS)
+    n_cols = (cols + 1) // 2 if symmetric else cols
+
+    # Probe nodes and target temperatures for event detection
+    probe_rows, probe_cols = np.array([(rows-1, center)] if probes is None else probes, dtype=int).reshape(-1, 2).T
+    if symmetric:
+        probe_cols = np.minimum(probe_cols, cols-1 - probe_cols)
+    thresholds = np.atleast_1d(to_si(T_s, TEMP_UNITS)).astype(float)
+    crossing_times = np.full(shape=[probe_rows.size, thresholds.size], fill_value=np.nan)
+    recent_times = deque(maxlen=4)
+    recent_temps = deque(maxlen=4)
+
+    # Probes in the top row read the top surface temperature, extrapolated from the cell centers
+    top_probes = probe_rows == rows-1
+    T_amb_s = to_si(T_amb, TEMP_UNITS)
+    if table is None:
+        cell_biot = to_si(biot, ureg.dimensionless) / rows
+        surface = lambda temp: _top_surface_temp(temp, T_amb_s, cell_biot)
+    else:
+        h_dx = to_si(h_value, H_UNITS) * to_si(dx, LENGTH_UNITS)
+        surface = lambda temp: _top_surface_temp(temp, T_amb_s, h_dx / table.lookup(table.k_value, temp))
+
+    # Preallocated, decimated recording of probe histories and full-field snapshots
+    recorder = ProbeRecorder(probes=probes) if recorder is None else recorder
+    recorder.start(shape=(rows, cols), n_steps=times, dt=dt_s, symmetric=symmetric, surface=surface)
+    recorders = [recorder]
+    if snapshots is not None:
+        snapshots.start(shape=(rows, cols), n_steps=times, dt=dt_s, symmetric=symmetric)
+        recorders.append(snapshots)
+
+    # Precompute coefficients once, pre-sliced to the neighbour each one multiplies
+    if table is not None:
+        # Faces of every node, for rebuilding the stencil each step: neighbour and flux face counts from the
+        # fo part, convective face counts from the biot part at a cell Biot number of 1
+        base, conduction, convection = (_build_stencil(fo=fo_, biot=biot_, rows=rows, cols=cols, symmetric=symmetric)
+                                        for fo_, biot_ in ((0., 0.), (1., 0.), (1., rows)))
+        structure = (conduction - base, (convection - conduction)[5] / _face_biot(1.))
+        fo, biot, k_value = 0., 0., 1.
+        variable_args = (to_si(h_value, H_UNITS), to_si(dx, LENGTH_UNITS), dt_s, to_si(T_amb, TEMP_UNITS),
+                         to_si(flux, FLUX_UNITS))
+    c_self, c_left, c_right, c_down, c_up, c_amb, c_flux = _build_stencil(fo=fo, biot=biot, rows=rows, cols=cols,
+                                                                          symmetric=symmetric)
+    if check_units:
+        source = (c_amb * T_amb.to(ureg.degK) + c_flux * (dx / k_value * flux)).to(ureg.degK)
+        temp_arr = np.full(shape=[rows, n_cols], fill_value=T_i.m_as(ureg.degK), dtype=float) * ureg.degK
+        new_temp_arr = np.empty(shape=[rows, n_cols]) * ureg.degK
+    else:
+        source = c_amb * to_si(T_amb, TEMP_UNITS) + c_flux * (to_si(dx, LENGTH_UNITS) / to_si(k_value, K_UNITS) *
+                                                             to_si(flux, FLUX_UNITS))
+        temp_arr = np.full(shape=[rows, n_cols], fill_value=to_si(T_i, TEMP_UNITS), dtype=float)
+        new_temp_arr = np.empty(shape=[rows, n_cols])
+    if method == 'explicit':
+        stencil = (c_self, source, c_left[:, 1:], c_right[:, :-1], c_down[1:, :], c_up[:-1, :])
+    else:
+        lu, rhs_operator = _implicit_factorization(to_si(fo, ureg.dimensionless), to_si(biot, ureg.dimensionless),
+                                                   rows, cols, method, symmetric)
+
+    # Continue from a checkpoint: restore the field, crossing state and recorded history
+    start_step, skip_record = 0, -1
+    if resume is not None:
+        state = load_checkpoint(resume) if isinstance(resume, str) else resume
+        if (state['field'].shape != temp_arr.shape or not np.isclose(state['dt'], dt_s)
+                or not np.array_equal(state['thresholds'], thresholds)
+                or not np.array_equal(state['probe_rows'], probe_rows)
+                or not np.array_equal(state['probe_cols'], probe_cols)):
+            raise ValueError("Checkpoint does not match this grid, dt, probes and T_s")
+        start_step = int(state['step'])
+        if start_step > times:
+            raise ValueError("time ends before the checkpoint at {} s".format(float(state['time'])))
+        np.copyto(getattr(temp_arr, 'magnitude', temp_arr), state['field'])
+        crossing_times[...] = state['crossing_times']
+        recent_times.extend(state['recent_times'])
+        recent_temps.extend(state['recent_temps'])
+        recorder.restore(state)
+        # A run stopped at its target already recorded its last step
+        skip_record = start_step if state['recorded'] else -1
+    reached = not np.isnan(crossing_times).any()
+    next_step, recorded = start_step, False
+
+    # Instrumentation is opt-in; without it the loop only pays for the `instrumented` and `timed` checks.
+    # Phase timings are only taken if instrument.timings is set.
+    instrumented = instrument is not None
+    timed = instrumented and instrument.timings
+    if instrumented:
+        instrument.start(n_steps=times, n_nodes=temp_arr.size, start_step=start_step)
+        conversions = _COUNTERS['unit_conversions']
+
+    # Double buffers: p values in temp_arr, p+1 values written into new_temp_arr, then swapped
+    for p in range(start_step, times):
+        if timed:
+            t_record = perf_counter()
+
+        # Save time and probe temp values
+        plot_time = p * dt_s
+        field = to_si(temp_arr, TEMP_UNITS)
+        probe_temps = field[probe_rows, probe_cols]
+        probe_temps[top_probes] = surface(probe_temps[top_probes])
+        if p != skip_record:
+            for rec in recorders:
+                rec.record(step=p, time=plot_time, field=field)
+
+            # Check if any probe has reached its operating temp for the first time
+            recent_times.append(plot_time)
+            recent_temps.append(probe_temps)
+            new_crossings = np.isnan(crossing_times) & (probe_temps[:, None] >= thresholds[None, :])
+            if new_crossings.any():
+                for k, n in zip(*np.nonzero(new_crossings)):
+                    crossing_times[k, n] = plot_time if p == 0 else _crossing_time(
+                        recent_times, [temps[k] for temps in recent_temps], thresholds[n], interpolation)
+                reached = not np.isnan(crossing_times).any()
+        if stop_at_target and reached:
+            next_step, recorded = p, True
+            break
+
+        # Calculate p+1 values and swap buffers
+        if timed:
+            t_update = perf_counter()
+        if table is not None:
+            stencil = _variable_stencil(structure, table, temp_arr, *variable_args)
+        if method == 'explicit':
+            _explicit_step(temp_arr, new_temp_arr, stencil)
+        else:
+            _implicit_step(temp_arr, new_temp_arr, lu, rhs_operator, source)
+        if timed:
+            t_copy = perf_counter()
+        temp_arr, new_temp_arr = new_temp_arr, temp_arr
+        next_step = p + 1
+        if checkpoint is not None and checkpoint.due(step=next_step, time=next_step * dt_s):
+            checkpoint.save(_checkpoint_state(next_step, False, dt_s, temp_arr, crossing_times, recent_times,
+                                              recent_temps, recorder, probe_rows, probe_cols, thresholds))
+
+        if instrumented:
+            if timed:
+                instrument.add_step(record=t_update - t_record, update=t_copy - t_update,
+                                    copy=perf_counter() - t_copy)
+            else:
+                instrument.add_step()
+            if p % instrument.every == 0 and instrument.on_step(step=p, time=plot_time, probe_temps=probe_temps):
+                break
+
+    if instrumented:
+        instrument.finish(unit_conversions=_COUNTERS['unit_conversions'] - conversions)
+    if checkpoint is not None:
+        checkpoint.save(_checkpoint_state(next_step, recorded, dt_s, temp_arr, crossing_times, recent_times,
+                                          recent_temps, recorder, probe_rows, probe_cols, thresholds))
+
+    # Reattach units once on exit
+    if probes is None:
+        crossing_times = crossing_times[0]
+    if np.ndim(T_s) == 0:
+        crossing_times = crossing_times.take(0, axis=-1)
+    time_to_operating_temp = Q_(crossing_times, TIME_UNITS)
+    top_center_temp = Q_(surface(to_si(temp_arr[rows-1, center], TEMP_UNITS)), TEMP_UNITS)
+    if snapshots is not None:
+        snapshots.close()
+    plot_times_list = Q_(recorder.times.copy(), TIME_UNITS)
+    plot_temps_list = Q_(recorder.temps[:, 0].copy() if recorder.temps.shape[1] == 1 else recorder.temps.copy(),
+                         TEMP_UNITS)
     return time_to_operating_temp, top_center_temp, plot_times_list, plot_temps_list
 
 
+def calc_finite_difference_batch(fo=None, biot=None, T_i=None, flux=None, k_value=None, thickness=None,
+                                 width=None, T_amb=None, dx=None, time=3100., dt=None, T_s=None,
+                                 method='explicit', stop_at_target=True, interpolation='linear', symmetric=False):
+    """
+    March N configurations together in one (N, rows, cols) array. fo, biot, T_i, flux, k_value, T_amb,
+    dt and T_s may each be a scalar or a length-N array (one value per member). thickness, width, dx and
+    time are shared, so every member uses the same grid. Each member advances with its own dt. It
+    retires from the batch when it reaches its top center T_s (if stop_at_target) or its time horizon.
+
+    Returns the same four results as calc_finite_difference, one per member: crossing times (N,),
+    final top center surface temps (N,) and (N, steps) time/temperature histories padded with NaN.
+    symmetric=True solves only the left half of the width, as in calc_finite_difference.
+    """
+    if method not in FD_METHODS:
+        raise ValueError("method must be one of {}".format(FD_METHODS))
+    if interpolation not in CROSSING_INTERPOLATIONS:
+        raise ValueError("interpolation must be one of {}".format(CROSSING_INTERPOLATIONS))
+
+    # Per-member parameters as float64 arrays of length N
+    fo, biot, T_i, flux, k_value, T_amb, dt, T_s = (np.array(arr, dtype=float) for arr in np.broadcast_arrays(
+        to_si(fo, ureg.dimensionless), to_si(biot, ureg.dimensionless), to_si(T_i, TEMP_UNITS), to_si(flux, FLUX_UNITS),
+        to_si(k_value, K_UNITS), to_si(T_amb, TEMP_UNITS), to_si(dt, TIME_UNITS), to_si(T_s, TEMP_UNITS)))
+    fo, biot, T_i, flux, k_value, T_amb, dt, T_s = (np.atleast_1d(arr) for arr in
+                                                    (fo, biot, T_i, flux, k_value, T_amb, dt, T_s))
+    n_members = fo.size
+
+    # Constants
+    dx = to_si(dx, LENGTH_UNITS)
+    rows, cols = _grid_shape(thickness=thickness, width=width, dx=dx)
+    times = (to_si(time, TIME_UNITS) / dt).astype(int)
+    center = int(0.5*(cols-1))
+    cell_biot = biot / rows
+
+    plot_times = np.full(shape=[n_members, times.max()], fill_value=np.nan)
+    plot_temps = np.full(shape=[n_members, times.max()], fill_value=np.nan)
+    crossing_times = np.full(shape=n_members, fill_value=np.nan)
+    top_center_temps = np.full(shape=n_members, fill_value=np.nan)
+
+    # Stacked coefficients, one stencil per member
+    coeffs = np.stack([_build_stencil(fo=fo[n], biot=biot[n], rows=rows, cols=cols, symmetric=symmetric)
+                       for n in range(n_members)], axis=1)
+    c_self, c_left, c_right, c_down, c_up, c_amb, c_flux = coeffs
+    source = c_amb * T_amb[:, None, None] + c_flux * (dx / k_value * flux)[:, None, None]
+    if method == 'explicit':
+        stencil = (c_self, source, c_left[..., :, 1:], c_right[..., :, :-1], c_down[..., 1:, :], c_up[..., :-1, :])
+    else:
+        factors = [_implicit_factorization(fo[n], biot[n], rows, cols, method, symmetric) for n in range(n_members)]
+
+    temp_arr = np.empty(shape=coeffs.shape[1:])
+    temp_arr[...] = T_i[:, None, None]
+    new_temp_arr = np.empty(shape=coeffs.shape[1:])
+    active = np.arange(n_members)
+
+    for p in range(times.max()):
+        # Save time and top center surface temp value of every active member
+        top_center = _top_surface_temp(temp_arr[:, rows-1, center], T_amb[active], cell_biot[active])
+        plot_times[active, p] = p * dt[active]
+        plot_temps[active, p] = top_center
+
+        # Event detection, then retire members that reached their target
+        new_crossings = np.nonzero(np.isnan(crossing_times[active]) & (top_center >= T_s[active]))[0]
+        for local in new_crossings:
+            n = active[local]
+            crossing_times[n] = 0. if p == 0 else _crossing_time(
+                plot_times[n, max(p-3, 0):p+1], plot_temps[n, max(p-3, 0):p+1], T_s[n], interpolation)
+        done = np.zeros(shape=active.size, dtype=bool)
+        if stop_at_target and new_crossings.size:
+            done[new_crossings] = True
+            top_center_temps[active[done]] = top_center[done]
+
+        # Calculate p+1 values and swap buffers
+        if method == 'explicit':
+            _explicit_step(temp_arr, new_temp_arr, stencil)
+        else:
+            for local, n in enumerate(active):
+                if not done[local]:
+                    _implicit_step(temp_arr[local], new_temp_arr[local], *factors[n], source[local])
+        temp_arr, new_temp_arr = new_temp_arr, temp_arr
+
+        # Members that have completed their own number of steps also retire
+        horizon = ~done & (p + 1 >= times[active])
+        top_center_temps[active[horizon]] = _top_surface_temp(temp_arr[horizon, rows-1, center],
+                                                              T_amb[active[horizon]], cell_biot[active[horizon]])
+        done |= horizon
+        if done.any():
+            keep = ~done
+            active = active[keep]
+            if not active.size:
+                break
+            temp_arr, new_temp_arr, source = temp_arr[keep], new_temp_arr[keep], source[keep]
+            if method == 'explicit':
+                stencil = tuple(c[keep] for c in stencil)
+
+    # Reattach units once on exit
+    return (Q_(crossing_times, TIME_UNITS), Q_(top_center_temps, TEMP_UNITS), Q_(plot_times, TIME_UNITS),
+            Q_(plot_temps, TEMP_UNITS))
+
+
+def align_histories(times=None, temps=None, time_axis=None):
+    """
+    Linearly interpolate histories onto one common time axis. times and temps are (N, steps) histories
+    padded with NaN after their last sample, as returned by calc_finite_difference_batch, or a single 1-D
+    history. Returns (N, len(time_axis)) temperatures, NaN outside each history's recorded span.
+    """
+    t = np.atleast_2d(np.asarray(to_si(times, TIME_UNITS), dtype=float))
+    y = np.atleast_2d(np.asarray(to_si(temps, TEMP_UNITS), dtype=float))
+    x = np.asarray(to_si(time_axis, TIME_UNITS), dtype=float)
+    valid = ~np.isnan(t)
+    first = np.where(valid, t, np.inf).min(axis=1)
+    last = np.where(valid, t, -np.inf).max(axis=1)
+
+    # Pad each row with its last sample and shift the rows apart in time, so a single np.interp call
+    # covers every history
+    rows = np.arange(t.shape[0])
+    t = np.where(valid, t, last[:, None])
+    y = np.where(valid, y, y[rows, valid.sum(axis=1) - 1][:, None])
+    offsets = rows[:, None] * (last.max() - first.min() + 1.)
+    aligned = np.interp((x + offsets).ravel(), (t + offsets).ravel(), y.ravel()).reshape(rows.size, x.size)
+    aligned[(x < first[:, None]) | (x > last[:, None])] = np.nan
+    return Q_(aligned, TEMP_UNITS)
+
+
+def calc_lumped_fd_comparison(materials=None, h_value=None, flux=None, thickness=None, width=None, T_amb=None,
+                              T_i=None, dx=None, time=3100., time_axis=None, n_points=200, method='explicit',
+                              symmetric=False):
+    """
+    Top center temperature curves from the lumped model and the finite difference method for every
+    material, on one common time axis. materials maps a name to a dict with 'rho', 'cp' and 'k_value'.
+    All materials march together through calc_finite_difference_batch (each at its stable dt), and
+    the lumped curves come from one broadcast evaluation.
+
+    time_axis defaults to n_points adaptive samples of the most strongly bending lumped curve from
+    0 to the end of the shortest finite difference history. A history's last sample is one step
+    before time, because the state after the final step is not recorded. Returns a dict with
+    'materials' (names), 'time' (the axis), and 'lumped' and 'finite_difference' temperatures of shape
+    (materials, len(time)).
+    """
+    names = list(materials)
+    rho, cp, k = np.array([[to_si(m['rho'], RHO_UNITS), to_si(m['cp'], CP_UNITS), to_si(m['k_value'], K_UNITS)]
+                           for m in materials.values()], dtype=float).T
+    h, L, dx_s = to_si(h_value, H_UNITS), to_si(thickness, LENGTH_UNITS), to_si(dx, LENGTH_UNITS)
+    dt = stable_dt(h, k, L, rho, cp, dx_s)
+    biot = biot_number(h, k, L)
+    fo = fourier_number(k, rho, cp, dt, dx_s)
+    fd_times, fd_temps = calc_finite_difference_batch(fo=fo, biot=biot, T_i=T_i, flux=flux, k_value=k,
+                                                      thickness=thickness, width=width, T_amb=T_amb,
+                                                      dx=dx, time=time, dt=dt, T_s=np.inf, method=method,
+                                                      stop_at_target=False, symmetric=symmetric)[2:]
+    if time_axis is None:
+        a = lumped_coefficients(h, rho, L, cp, 0.)[0]
+        t_end = np.nanmax(fd_times.magnitude, axis=1).min()
+        time_axis = _adaptive_lumped_times(np.max(a, keepdims=True), t_end, n_points)[0]
+    lumped = calc_lumped_curve(T_amb=T_amb, T_i=T_i, h_value=h_value, rho=rho, thickness=thickness, cp=cp,
+                               flux=flux, time=time_axis)
+    return {'materials': names, 'time': Q_(to_si(time_axis, TIME_UNITS), TIME_UNITS), 'lumped': lumped,
+            'finite_difference': align_histories(times=fd_times, temps=fd_temps, time_axis=time_axis)}
+
+
+def calc_steady_state_field(biot=None, flux=None, k_value=None, thickness=None, width=None, T_amb=None, dx=None,
+                            symmetric=False, solver='direct', tol=1e-10):
+    """
+    Steady 2D temperature field of the plancha from one sparse linear solve. Uses the same node
+    equations as calc_finite_difference with the time derivative set to zero, i.e. L T + source = 0
+    for the stencil assembled at fo = 1 (L and the source both scale with fo, so it cancels).
+
+    solver='direct' factorizes the system (sparse LU). solver='iterative' uses conjugate gradients with a
+    diagonal (Jacobi) preconditioner on -L, which is symmetric positive definite because every face
+    enters the two cells it joins with the same weight. symmetric=True solves the half width and mirrors
+    the result. When the symmetry axis runs through the middle column, that column is only half a cell
+    of the half grid and its equations are halved to keep the system symmetric.
+
+    Returns the full (rows, cols) field of cell center temperatures and the top center surface
+    temperature, extrapolated from the top row as in calc_finite_difference.
+    """
+    if solver not in STEADY_SOLVERS:
+        raise ValueError("solver must be one of {}".format(STEADY_SOLVERS))
+    from scipy.sparse import diags
+    from scipy.sparse.linalg import spsolve, cg
+    rows, cols = _grid_shape(thickness=thickness, width=width, dx=dx)
+    center = int(0.5*(cols-1))
+
+    c_self, c_left, c_right, c_down, c_up, c_amb, c_flux = _build_stencil(fo=1., biot=biot, rows=rows, cols=cols,
+                                                                          symmetric=symmetric)
+    L = _stencil_operator(c_self, c_left, c_right, c_down, c_up)
+    source = c_amb * to_si(T_amb, TEMP_UNITS) + c_flux * (to_si(dx, LENGTH_UNITS) / to_si(k_value, K_UNITS) *
+                                                         to_si(flux, FLUX_UNITS))
+    if solver == 'direct':
+        temps = spsolve(L, -source.ravel())
+    else:
+        if symmetric and cols % 2:
+            # The folded column couples twice to its left neighbour; halving its rows restores symmetry
+            weights = np.ones(c_self.shape)
+            weights[:, -1] = 0.5
+            L = diags(weights.ravel()) @ L
+            source = weights * source
+        A = -L.tocsr()
+        preconditioner = diags(1 / A.diagonal())
+        temps, info = cg(A, source.ravel(), x0=np.full(A.shape[0], to_si(T_amb, TEMP_UNITS)), rtol=tol,
+                         M=preconditioner)
+        if info != 0:
+            raise RuntimeError("Steady state iterative solve did not converge (info = {})".format(info))
+
+    field = temps.reshape(c_self.shape)
+    if symmetric:
+        field = unfold_symmetric(field, cols)
+    top_center = _top_surface_temp(field[rows-1, center], to_si(T_amb, TEMP_UNITS),
+                                   to_si(biot, ureg.dimensionless) / rows)
+    return Q_(field, TEMP_UNITS), Q_(top_center, TEMP_UNITS)
+
+
+def calc_convergence_study(h_value=None, k_value=None, rho=None, cp=None, T_i=None, flux=None, thickness=None,
+                           width=None, T_amb=None, T_s=None, time=3100., divisions=(3, 6, 12, 24),
+                           dt=None, method='explicit', quantity='time', tolerance=None):
+    """
+    Grid convergence study of the finite difference solution. Runs dx = thickness/n for each n in
+    divisions, which should grow geometrically (e.g. doubling). dt is the stability limit of each grid
+    unless given. quantity is 'time' (time for the top center to reach T_s) or 'temperature' (top center
+    temperature at the end of time). For 'temperature', dt is shortened where needed so that every level
+    ends exactly at time.
+
+    From every three successive levels the observed order of accuracy p is
+        p = log(|f1 - f2| / |f2 - f3|) / log(r)
+    and the finest levels are Richardson-extrapolated to f3 + (f3 - f2) / (r^p - 1). The error of each
+    level is estimated against the extrapolated value.
+
+    With a tolerance, refinement stops at the first level whose estimated error is within tolerance,
+    so no finer grid is run than needed. That level is returned as chosen_dx (None if never reached).
+    Returns a dict with dx, values, order, error, extrapolated and chosen_dx.
+    """
+    if quantity not in ('time', 'temperature'):
+        raise ValueError("quantity must be 'time' or 'temperature'")
+    units = TIME_UNITS if quantity == 'time' else TEMP_UNITS
+    biot = calc_biot(h_value=h_value, k_value=k_value, thickness=thickness)
+
+    dxs, values, orders, errors = [], [], [], []
+    extrapolated = np.nan
+    chosen_dx = None
+    for n in divisions:
+        dx = thickness / n
+        dt_n = stability_analysis(h_value=h_value, k_value=k_value, thickness=thickness, rho=rho, cp=cp,
+                                  dx=dx) if dt is None else dt
+        if quantity == 'temperature':
+            # Every level must end at the same instant, so shorten dt to fit a whole number of steps in time.
+            # The small margin keeps int(time / dt) in the march from rounding down to one step fewer.
+            t_end = to_si(time, TIME_UNITS)
+            steps = np.ceil(t_end / to_si(dt_n, TIME_UNITS))
+            dt_n = Q_(t_end / (steps * (1 + 1e-12)), TIME_UNITS)
+        fo = calc_fo(k_value=k_value, rho=rho, cp=cp, delta_t=dt_n, delta_x=dx)
+
+        # Only the crossing time or final temperature is needed, so skip recording the history
+        result = calc_finite_difference(fo=fo, biot=biot, T_i=T_i, flux=flux, k_value=k_value, thickness=thickness,
+                                        width=width, T_amb=T_amb, dx=dx, time=time, dt=dt_n, T_s=T_s, method=method,
+                                        stop_at_target=(quantity == 'time'),
+                                        recorder=ProbeRecorder(every=np.iinfo(int).max))
+        dxs.append(to_si(dx, LENGTH_UNITS))
+        values.append(to_si(result[0] if quantity == 'time' else result[1], units))
+
+        # Observed order and Richardson extrapolation from the last three levels
+        order = np.nan
+        if len(values) >= 3:
+            f1, f2, f3 = values[-3:]
+            r = dxs[-2] / dxs[-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                order = np.log(abs(f1 - f2) / abs(f2 - f3)) / np.log(r)
+                extrapolated = f3 + (f3 - f2) / (r**order - 1)
+        orders.append(order)
+        errors.append(abs(values[-1] - extrapolated))
+        if tolerance is not None and errors[-1] <= to_si(tolerance, units):
+            chosen_dx = Q_(dxs[-1], LENGTH_UNITS)
+            break
+
+    # Error estimates of the coarser levels against the final extrapolation
+    errors = np.abs(np.array(values) - extrapolated)
+    return {'dx': Q_(np.array(dxs), LENGTH_UNITS), 'values': Q_(np.array(values), units),
+            'order': np.array(orders), 'error': Q_(errors, units), 'extrapolated': Q_(extrapolated, units),
+            'chosen_dx': chosen_dx}
+
+
 if __name__ == "__main__":
     print('Executed')
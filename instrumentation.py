@@ -0,0 +1,96 @@
+"""
+Instrumentation for the finite difference time march: callbacks every N steps, wall-clock timings
+of the update, copy and recording phases, and counters for steps, node updates and unit
+conversions. Pass an Instrumentation to calc_finite_difference(instrument=...). Without one the
+march does no timing or callback work at all.
+"""
+
+import sys
+import time as _time
+
+
+class Instrumentation:
+    """
+    callbacks are called every `every` steps as callback(step=..., time=..., probe_temps=...,
+    instrumentation=self). A callback that returns True stops the march, as does exceeding
+    max_wall_time seconds. Set timings=False to keep only the counters and callbacks; the march then
+    takes no per-step clock readings.
+    """
+    def __init__(self, callbacks=None, every=1, timings=True, max_wall_time=None):
+        self.callbacks = list(callbacks or [])
+        self.every = every
+        self.timings = timings
+        self.max_wall_time = max_wall_time
+        self.reset()
+
+    def reset(self):
+        self.counters = {'steps': 0, 'node_updates': 0, 'unit_conversions': 0}
+        self.phase_times = {'update': 0., 'copy': 0., 'record': 0.}
+        self.n_steps = 0
+        self.n_nodes = 0
+        self.start_step = 0
+        self.aborted = False
+        self._start = None
+
+    def start(self, n_steps=None, n_nodes=None, start_step=0):
+        # n_steps is the total horizon; a resumed march begins at start_step rather than 0
+        self.reset()
+        self.n_steps = n_steps
+        self.n_nodes = n_nodes
+        self.start_step = start_step
+        self._start = _time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return _time.perf_counter() - self._start
+
+    def add_step(self, record=0., update=0., copy=0.):
+        self.counters['steps'] += 1
+        self.counters['node_updates'] += self.n_nodes
+        self.phase_times['record'] += record
+        self.phase_times['update'] += update
+        self.phase_times['copy'] += copy
+
+    def on_step(self, step=None, time=None, probe_temps=None):
+        # Returns True if the march should stop
+        stop = False
+        for callback in self.callbacks:
+            stop |= bool(callback(step=step, time=time, probe_temps=probe_temps, instrumentation=self))
+        if self.max_wall_time is not None and self.elapsed > self.max_wall_time:
+            stop = True
+        self.aborted = stop
+        return stop
+
+    def finish(self, unit_conversions=0):
+        self.counters['unit_conversions'] = unit_conversions
+        self.wall_time = self.elapsed
+
+    def summary(self):
+        lines = ["{} steps, {} node updates, {} unit conversions in {:.3f} s{}".format(
+            self.counters['steps'], self.counters['node_updates'], self.counters['unit_conversions'],
+            self.wall_time, " (aborted)" if self.aborted else "")]
+        if self.timings:
+            for phase, seconds in self.phase_times.items():
+                lines.append("    {}: {:.3f} s".format(phase, seconds))
+        if self.wall_time > 0:
+            lines.append("    {:.3e} node updates/s".format(self.counters['node_updates'] / self.wall_time))
+        return "\n".join(lines)
+
+
+class ProgressReporter:
+    # Callback that prints progress and an ETA based on the average wall time per step so far. Progress
+    # counts from the step the march started at, so resumed runs report only their own work.
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+
+    def __call__(self, step=None, time=None, probe_temps=None, instrumentation=None):
+        done = step + 1 - instrumentation.start_step
+        total = instrumentation.n_steps - instrumentation.start_step
+        eta = instrumentation.elapsed / done * (total - done)
+        self.stream.write("step {}/{} ({:.1%}), t = {:.2f} s, ETA {:.1f} s\n".format(
+            step + 1, instrumentation.n_steps, done / total, time, eta))
+        return False
+
+
+if __name__ == "__main__":
+    print('Executed')
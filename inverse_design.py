@@ -0,0 +1,107 @@
+"""
+Inverse design: find the flux, h_value or thickness for which the plancha reaches T_s in a target
+time. Root-finding (Brent's method) runs over forward heat-up solves. The forward solve is either the
+analytic lumped capacitance model or an early-terminating finite difference run. Forward results
+are cached within a query, so bracketing and root-finding share them.
+"""
+
+from __init__ import ureg, Q_
+import numpy as np
+import calc_functions as cf
+from recorders import ProbeRecorder
+
+DESIGN_PARAMETERS = {'flux': cf.FLUX_UNITS, 'h_value': cf.H_UNITS, 'thickness': cf.LENGTH_UNITS}
+
+
+def _heat_up_time(model=None, inputs=None, divisions=None, method=None, dt=None, horizon=None):
+    """
+    Forward solve in SI floats. Targets not reached (or reached after horizon) return horizon, so the
+    residual stays finite and keeps its sign for the root finder.
+    """
+    h, k, rho, cp, L = inputs['h_value'], inputs['k_value'], inputs['rho'], inputs['cp'], inputs['thickness']
+    if model == 'lumped':
+        a, b = cf.lumped_coefficients(h, rho, L, cp, inputs['flux'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            time = cf.lumped_time(a, b, inputs['T_amb'], inputs['T_i'], inputs['T_s'])
+    else:
+        dx = L / divisions
+        dt = cf.stable_dt(h, k, L, rho, cp, dx) if dt is None else dt
+        fo, biot = cf.fourier_number(k, rho, cp, dt, dx), cf.biot_number(h, k, L)
+        # Only the crossing time is needed: stop at the target and skip the history
+        time = cf.calc_finite_difference(fo=fo, biot=biot, T_i=inputs['T_i'], flux=inputs['flux'],
+                                         k_value=k, thickness=L, width=inputs['width'],
+                                         T_amb=inputs['T_amb'], dx=dx, time=horizon, dt=dt, T_s=inputs['T_s'],
+                                         method=method, stop_at_target=True,
+                                         recorder=ProbeRecorder(every=np.iinfo(int).max))[0].magnitude
+    return horizon if np.isnan(time) or time > horizon else float(time)
+
+
+def solve_inverse_design(parameter='flux', target_time=None, model='lumped', h_value=None, k_value=None, rho=None,
+                         cp=None, T_i=None, flux=None, thickness=None, width=None, T_amb=None, T_s=None, divisions=3,
+                         method='explicit', dt=None, bracket=None, horizon_factor=2., xtol=1e-8):
+    """
+    Find the value of parameter ('flux', 'h_value' or 'thickness') for which the top of the plancha
+    reaches T_s in target_time. The other inputs are fixed. The given value of parameter is the
+    starting guess.
+
+    model='lumped' uses the analytic lumped capacitance time. model='finite_difference' runs
+    calc_finite_difference on dx = thickness/divisions (dt from stability_analysis unless given).
+    Each run stops at the first crossing of T_s, or after horizon_factor * target_time. Finite
+    difference queries are warm-started from the lumped solution.
+
+    The root is bracketed by expanding geometrically around the guess, unless bracket=(low, high) is
+    given. Returns the parameter as a Quantity and a dict with the number of forward solves and the
+    achieved heat-up time.
+    """
+    from scipy.optimize import brentq
+    if parameter not in DESIGN_PARAMETERS:
+        raise ValueError("parameter must be one of {}".format(tuple(DESIGN_PARAMETERS)))
+    if model not in ('lumped', 'finite_difference'):
+        raise ValueError("model must be 'lumped' or 'finite_difference'")
+    units = DESIGN_PARAMETERS[parameter]
+    inputs = {'h_value': cf.to_si(h_value, cf.H_UNITS), 'k_value': cf.to_si(k_value, cf.K_UNITS),
+              'rho': cf.to_si(rho, cf.RHO_UNITS), 'cp': cf.to_si(cp, cf.CP_UNITS), 'T_i': cf.to_si(T_i, cf.TEMP_UNITS),
+              'flux': cf.to_si(flux, cf.FLUX_UNITS), 'thickness': cf.to_si(thickness, cf.LENGTH_UNITS),
+              'width': cf.to_si(width, cf.LENGTH_UNITS), 'T_amb': cf.to_si(T_amb, cf.TEMP_UNITS),
+              'T_s': cf.to_si(T_s, cf.TEMP_UNITS)}
+    target = cf.to_si(target_time, cf.TIME_UNITS)
+    horizon = horizon_factor * target
+    dt = None if dt is None else cf.to_si(dt, cf.TIME_UNITS)
+
+    # Warm start the finite difference search from the cheap analytic answer
+    guess = inputs[parameter]
+    if model == 'finite_difference' and bracket is None:
+        try:
+            guess = solve_inverse_design(parameter=parameter, target_time=target, model='lumped',
+                                         **{**inputs, parameter: guess})[0].magnitude
+        except ValueError:
+            pass
+
+    cache = {}
+
+    def residual(x):
+        if x not in cache:
+            cache[x] = _heat_up_time(model=model, inputs={**inputs, parameter: x}, divisions=divisions,
+                                     method=method, dt=dt, horizon=horizon)
+        return cache[x] - target
+
+    if bracket is None:
+        low, high = guess, guess
+        for _ in range(60):
+            low, high = low / 1.5, high * 1.5
+            if np.sign(residual(low)) != np.sign(residual(high)):
+                break
+        else:
+            raise ValueError("No {} between {:.3g} and {:.3g} reaches T_s in the target time".format(
+                parameter, low, high))
+    else:
+        low, high = (cf.to_si(b, units) for b in bracket)
+        if np.sign(residual(low)) == np.sign(residual(high)):
+            raise ValueError("bracket does not contain a {} that reaches T_s in the target time".format(parameter))
+
+    value = brentq(residual, low, high, xtol=xtol * max(abs(guess), 1.), rtol=1e-10)
+    return Q_(value, units), {'forward_solves': len(cache), 'time': Q_(residual(value) + target, cf.TIME_UNITS)}
+
+
+if __name__ == "__main__":
+    print('Executed')
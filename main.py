@@ -8,10 +8,57 @@ Project 1 - Assumptions (Given):
 """
 
 from __init__ import ureg, Q_
-import calc_functions as cf
-
-
-def main():
+import argparse
+from math import isnan
+import scenarios as sc
+from result_cache import ResultCache
+
+MATERIAL_NAMES = ('Aluminum', 'Cast Iron', 'Ceramic')
+FD_TIME_HORIZON = 3100.    # seconds simulated by the finite difference heat-up jobs
+
+
+def build_jobs(materials=None, h_value=None, thickness=None, width=None, flux=None, T_amb=None, T_i=None, T_s=None,
+               dx=None, finite_difference=False):
+    # One independent job per task/material/method combination
+    heat_up = dict(thickness=thickness, width=width, flux=flux, T_amb=T_amb, T_i=T_i, T_s=T_s)
+    jobs = []
+    for name in MATERIAL_NAMES:
+        material = materials[name]
+        jobs.append(sc.Job('analysis', name, None, sc.analysis_numbers,
+                           dict(material=material, h_value=h_value, thickness=thickness, dx=dx)))
+        for task, h in (('task 1', h_value), ('task 6', h_value / 2)):
+            jobs.append(sc.Job(task, name, 'lumped', sc.lumped_heat_up_time,
+                               dict(material=material, h_value=h, **heat_up)))
+            if finite_difference:
+                jobs.append(sc.Job(task, name, 'finite difference', sc.finite_difference_heat_up_time,
+                                   dict(material=material, h_value=h, dx=dx, time=FD_TIME_HORIZON, **heat_up)))
+        jobs.append(sc.Job('task 2', name, 'lumped', sc.lumped_stored_energy,
+                           dict(material=material, h_value=h_value, **heat_up)))
+        jobs.append(sc.Job('task 6 half time', name, 'lumped', sc.lumped_temp_at_half_time,
+                           dict(material=material, h_value=h_value, **heat_up)))
+        if finite_difference:
+            jobs.append(sc.Job('task 4', name, 'finite difference', sc.finite_difference_steady_state,
+                               dict(material=material, h_value=h_value, thickness=thickness, width=width, flux=flux,
+                                    T_amb=T_amb, dx=dx)))
+    jobs.append(sc.Job('task 3', 'all', None, sc.convection_heat_loss,
+                       dict(h_value=h_value, thickness=thickness, width=width, T_amb=T_amb, T_plancha=T_s)))
+    jobs.append(sc.Job('task 4', 'all', None, sc.steady_state,
+                       dict(flux=flux, h_value=h_value, thickness=thickness, width=width, T_amb=T_amb)))
+    return jobs
+
+
+def print_heat_up_times(results=None, task=None, finite_difference=False):
+    for name in MATERIAL_NAMES:
+        print("    Lumped Capacitance method, {}: {}".format(name, round(results[(task, name, 'lumped')], 2)))
+    if finite_difference:
+        for name in MATERIAL_NAMES:
+            # NaN means the top center never reached T_s within the simulated time
+            time = results[(task, name, 'finite difference')]
+            time = "not reached within {:g} second".format(FD_TIME_HORIZON) if isnan(time.magnitude) else round(time, 2)
+            print("    Finite Difference method, {}: {}".format(name, time))
+
+
+def main(max_workers=None, finite_difference=False, cache_dir=None):
 
     # Given Variables
     width = Q_(45, ureg.cm).to(ureg.meter)
@@ -63,35 +110,27 @@ def main():
     # Selected delta x value
     dx = thickness / 3
 
-    # Check Biot number
-    biot_al = cf.calc_biot(h_value=h_air, k_value=k_al_300, thickness=thickness)
-    biot_fireclay = cf.calc_biot(h_value=h_air, k_value=k_fireclay_478, thickness=thickness)
-    biot_cast_iron = cf.calc_biot(h_value=h_air, k_value=k_cast_iron_300, thickness=thickness)
+    materials = {'Aluminum': dict(rho=rho_al_300, cp=cp_al_300, k_value=k_al_300),
+                 'Cast Iron': dict(rho=rho_cast_iron_300, cp=cp_cast_iron_300, k_value=k_cast_iron_300),
+                 'Ceramic': dict(rho=rho_fireclay_478, cp=cp_fireclay_478, k_value=k_fireclay_478)}
 
+    # Every task/material/method combination runs as an independent job on the process pool. With a
+    # cache directory, jobs whose inputs are unchanged since an earlier run are not recomputed.
+    jobs = build_jobs(materials=materials, h_value=h_air, thickness=thickness, width=width, flux=heat_flux,
+                      T_amb=T_amb, T_i=T_i, T_s=T_s, dx=dx, finite_difference=finite_difference)
+    cache = None if cache_dir is None else ResultCache(directory=cache_dir)
+    results = sc.run_jobs(jobs=jobs, max_workers=max_workers, cache=cache)
+
+    # Check Biot number
     print("The Biot numbers for each material is as follows... ")
-    print("    Aluminum: {}".format(round(biot_al, 3)))
-    print("    Cast Iron: {}".format(round(biot_cast_iron, 3)))
-    print("    Ceramic: {}".format(round(biot_fireclay, 3)))
+    for name in MATERIAL_NAMES:
+        print("    {}: {}".format(name, round(results[('analysis', name, None)][0], 3)))
     print("...")
 
     # Calc Fourier number
-    dt_al = cf.stability_analysis(h_value=h_air, k_value=k_al_300, thickness=thickness, rho=rho_al_300, cp=cp_al_300,
-                                  dx=dx)
-    dt_fireclay = cf.stability_analysis(h_value=h_air, k_value=k_fireclay_478, thickness=thickness,
-                                        rho=rho_fireclay_478, cp=cp_fireclay_478, dx=dx)
-    dt_cast_iron = cf.stability_analysis(h_value=h_air, k_value=k_cast_iron_300, thickness=thickness,
-                                         rho=rho_cast_iron_300, cp=cp_cast_iron_300, dx=dx)
-
-    fo_al = cf.calc_fo(k_value=k_al_300, rho=rho_al_300, cp=cp_al_300, delta_t=dt_al, delta_x=dx)
-    fo_fireclay = cf.calc_fo(k_value=k_fireclay_478, rho=rho_fireclay_478, cp=cp_fireclay_478, delta_t=dt_fireclay,
-                             delta_x=dx)
-    fo_cast_iron = cf.calc_fo(k_value=k_cast_iron_300, rho=rho_cast_iron_300, cp=cp_cast_iron_300,
-                              delta_t=dt_cast_iron, delta_x=dx)
-
     print("The Fourier numbers for each material is as follows... ")
-    print("    Aluminum: {}".format(round(fo_al, 3)))
-    print("    Cast Iron: {}".format(round(fo_cast_iron, 3)))
-    print("    Ceramic: {}".format(round(fo_fireclay, 3)))
+    for name in MATERIAL_NAMES:
+        print("    {}: {}".format(name, round(results[('analysis', name, None)][2], 3)))
     print("...")
 
     """
@@ -100,39 +139,8 @@ def main():
     Difference, if applicable.
     """
 
-    # METHOD 1: LUMPED CAPACITANCE
-
-    delta_t_lumped_al = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air, rho=rho_al_300,
-                                                   thickness=thickness, width=width, cp=cp_al_300, flux=heat_flux,
-                                                   T_final=T_s).to(ureg.seconds)
-    delta_t_lumped_fireclay = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air, rho=rho_fireclay_478,
-                                                         thickness=thickness, width=width, cp=cp_fireclay_478,
-                                                         flux=heat_flux, T_final=T_s).to(ureg.seconds)
-    delta_t_lumped_cast_iron = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air, rho=rho_cast_iron_300,
-                                                          thickness=thickness, width=width, cp=cp_cast_iron_300,
-                                                          flux=heat_flux, T_final=T_s).to(ureg.seconds)
-
-    # # METHOD 2: FINITE DIFFERENCE (UNFINISHED)
-    #
-    # delta_t_finite_diff_al = cf.calc_finite_difference(fo=fo_al, biot=biot_al, T_i=T_i, flux=heat_flux,
-    #                                                    k_value=k_al_300, thickness=thickness, width=width, T_amb=T_amb,
-    #                                                    dx=dx, dt=dt_al, T_s=T_s)
-    # delta_t_finite_diff_fireclay = cf.calc_finite_difference(fo=fo_fireclay, biot=biot_fireclay, T_i=T_i,
-    #                                                          flux=heat_flux, k_value=k_fireclay_478,
-    #                                                          thickness=thickness, width=width, T_amb=T_amb, dx=dx,
-    #                                                          dt=dt_fireclay, T_s=T_s)
-    # delta_t_finite_diff_cast_iron = cf.calc_finite_difference(fo=fo_cast_iron, biot=biot_cast_iron, T_i=T_i,
-    #                                                           flux=heat_flux, k_value=k_cast_iron_300,
-    #                                                           thickness=thickness, width=width, T_amb=T_amb, dx=dx,
-    #                                                           dt=dt_cast_iron, T_s=T_s)
-
     print("The time to heat to 250 degC for each material is as follows... ")
-    print("    Lumped Capacitance method, Aluminum: {}".format(round(delta_t_lumped_al, 2)))
-    print("    Lumped Capacitance method, Cast Iron: {}".format(round(delta_t_lumped_cast_iron, 2)))
-    print("    Lumped Capacitance method, Ceramic: {}".format(round(delta_t_lumped_fireclay, 2)))
-    # print("    Finite Difference method, Aluminum: {}".format(round(delta_t_finite_diff_al, 2)))
-    # print("    Finite Difference method, Cast Iron: {}".format(round(delta_t_finite_diff_cast_iron, 2)))
-    # print("    Finite Difference method, Ceramic: {}".format(round(delta_t_finite_diff_fireclay, 2)))
+    print_heat_up_times(results=results, task='task 1', finite_difference=finite_difference)
     print("...")
 
     """
@@ -140,54 +148,9 @@ def main():
     operating temperature of 250°C
     """
 
-    # METHOD 1: LUMPED CAPACITANCE
-
-    energy_stored_lumped_al_per_time = cf.calc_stored_energy_per_time(rho=rho_al_300, thickness=thickness, width=width,
-                                                                      cp=cp_al_300, T_i=T_i, T_final=T_s,
-                                                                      time=delta_t_lumped_al)
-    energy_stored_lumped_al = (energy_stored_lumped_al_per_time * delta_t_lumped_al).to(ureg.kjoules / ureg.meters)
-
-    energy_stored_lumped_ceramic_per_time = cf.calc_stored_energy_per_time(rho=rho_fireclay_478, thickness=thickness,
-                                                                           width=width, cp=cp_fireclay_478, T_i=T_i,
-                                                                           T_final=T_s, time=delta_t_lumped_fireclay)
-    energy_stored_lumped_ceramic = (energy_stored_lumped_ceramic_per_time * delta_t_lumped_fireclay).to(ureg.kjoules /
-                                                                                                        ureg.meters)
-
-    energy_stored_lumped_cast_iron_per_time = cf.calc_stored_energy_per_time(rho=rho_cast_iron_300, thickness=thickness,
-                                                                             width=width, cp=cp_cast_iron_300, T_i=T_i,
-                                                                             T_final=T_s, time=delta_t_lumped_cast_iron).to(ureg.watts / ureg.meter)
-    energy_stored_lumped_cast_iron = (energy_stored_lumped_cast_iron_per_time *
-                                      delta_t_lumped_cast_iron).to(ureg.kjoules / ureg.meters)
-
-    # # METHOD 2: FINITE DIFFERENCE
-    #
-    # energy_stored_finite_diff_al_per_time = cf.calc_stored_energy_per_time(rho=rho_al_300, thickness=thickness,
-    #                                                                        width=width, cp=cp_al_300, T_i=T_i,
-    #                                                                        T_final=T_s, time=delta_t_finite_diff_al)
-    # energy_stored_finite_diff_al = (energy_stored_finite_diff_al_per_time *
-    #                                 delta_t_finite_diff_al).to(ureg.kjoules / ureg.meters)
-    # energy_stored_finite_diff_fireclay_per_time = cf.calc_stored_energy_per_time(rho=rho_fireclay_478,
-    #                                                                              thickness=thickness, width=width,
-    #                                                                              cp=cp_fireclay_478, T_i=T_i,
-    #                                                                              T_final=T_s,
-    #                                                                              time=delta_t_finite_diff_fireclay)
-    # energy_stored_finite_diff_fireclay = (energy_stored_finite_diff_fireclay_per_time *
-    #                                       delta_t_finite_diff_fireclay).to(ureg.kjoules / ureg.meters)
-    # energy_stored_finite_diff_cast_iron_per_time = cf.calc_stored_energy_per_time(rho=rho_cast_iron_300,
-    #                                                                               thickness=thickness, width=width,
-    #                                                                               cp=cp_cast_iron_300, T_i=T_i,
-    #                                                                               T_final=T_s,
-    #                                                                               time=delta_t_finite_diff_cast_iron)
-    # energy_stored_finite_diff_cast_iron = (energy_stored_finite_diff_cast_iron_per_time *
-    #                                        delta_t_finite_diff_cast_iron).to(ureg.kjoules / ureg.meters)
-
     print("The energy stored in the plancha when it reaches 250 degC for each material is as follows... ")
-    print("    Lumped Capacitance method, Aluminum: {}".format(round(energy_stored_lumped_al, 2)))
-    print("    Lumped Capacitance method, Cast Iron: {}".format(round(energy_stored_lumped_cast_iron, 2)))
-    print("    Lumped Capacitance method, Ceramic: {}".format(round(energy_stored_lumped_ceramic, 2)))
-    # print("    Finite Difference method, Aluminum: {}".format(round(energy_stored_finite_diff_al, 2)))
-    # print("    Finite Difference method, Cast Iron: {}".format(round(energy_stored_finite_diff_cast_iron, 2)))
-    # print("    Finite Difference method, Ceramic: {}".format(round(energy_stored_finite_diff_fireclay, 2)))
+    for name in MATERIAL_NAMES:
+        print("    Lumped Capacitance method, {}: {}".format(name, round(results[('task 2', name, 'lumped')], 2)))
     print("...")
 
     """
@@ -196,8 +159,7 @@ def main():
     plancha for this. 
     """
 
-    conv_loss_per_length = cf.calc_convection_heat_loss(h_value=h_air, thickness=thickness, width=width, T_plancha=T_s,
-                                                        T_amb=T_amb).to(ureg.watts / ureg.meters)
+    conv_loss_per_length = results[('task 3', 'all', None)].to(ureg.watts / ureg.meters)
 
     print("The heat lost to convection (per length) when it has reached operating temperature is... ")
     print("    Heat lost to convection, all materials: {}".format(round(conv_loss_per_length, 2)))
@@ -208,14 +170,15 @@ def main():
     of the center of the plancha be for each material?
     """
 
-    T_ss = cf.calc_steady_state_temp(flux=heat_flux, h_value=h_air, width=width, thickness=thickness, T_amb=T_amb).to(ureg.degC)
-
-    conv_loss_at_steady_state_temp = cf.calc_convection_heat_loss(h_value=h_air, thickness=thickness, width=width,
-                                                                  T_amb=T_amb, T_plancha=T_ss).to(ureg.watts / ureg.meters)
+    T_ss, conv_loss_at_steady_state_temp = results[('task 4', 'all', None)]
 
     print("The steady state temperature for the center of the plancha for each material will be identical... ")
     print("    Steady State Temperature, all materials: {}".format(round(T_ss, 2)))
     print("    The heat lost at steady state temperature is: {}".format(round(conv_loss_at_steady_state_temp, 2)))
+    if finite_difference:
+        for name in MATERIAL_NAMES:
+            print("    Finite Difference steady state top center, {}: {}".format(
+                name, round(results[('task 4', name, 'finite difference')], 2)))
     print("...")
 
     """
@@ -224,8 +187,8 @@ def main():
     at 250°C? You may assume uniform temperature on the top and sides of the plancha. 
     """
 
-    steady_state_flux_250 = cf.calc_convection_heat_loss(h_value=h_air, thickness=thickness, width=width, T_amb=T_amb,
-                                                         T_plancha=T_s)
+    # Steady state flux balances the convection loss at 250 C (Task 3)
+    steady_state_flux_250 = results[('task 3', 'all', None)]
 
     print("The flux required for steady state temperature at 250 C will be identical for each material... ")
     print("    Steady State Applied Flux, all materials: {}".format(round(steady_state_flux_250, 2)))
@@ -236,75 +199,28 @@ def main():
     250°C changed?
     """
 
-    # METHOD 1: LUMPED CAPACITANCE
-
-    delta_t_lumped_al_half_h = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air/2, rho=rho_al_300,
-                                                          thickness=thickness, width=width, cp=cp_al_300,
-                                                          flux=heat_flux, T_final=T_s).to(ureg.seconds)
-    delta_t_lumped_fireclay_half_h = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air/2,
-                                                                rho=rho_fireclay_478, thickness=thickness, width=width,
-                                                                cp=cp_fireclay_478, flux=heat_flux,
-                                                                T_final=T_s).to(ureg.seconds)
-    delta_t_lumped_cast_iron_half_h = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air/2,
-                                                                 rho=rho_cast_iron_300, thickness=thickness,
-                                                                 width=width, cp=cp_cast_iron_300, flux=heat_flux,
-                                                                 T_final=T_s).to(ureg.seconds)
-
-    # # METHOD 2: FINITE DIFFERENCE
-    #
-    # bi_al_half_h = cf.calc_biot(h_value=0.5*h_air, k_value=k_al_300, thickness=thickness)
-    # dt_al_half_h = cf.stability_analysis(h_value=0.5*h_air, k_value=k_al_300, thickness=thickness, rho=rho_al_300,
-    #                                      cp=cp_al_300, dx=dx)
-    # delta_t_finite_diff_al_half_h = cf.calc_finite_difference(fo=fo_al, biot=bi_al_half_h, T_i=T_i, flux=heat_flux,
-    #                                                           k_value=k_al_300, thickness=thickness, width=width,
-    #                                                           T_amb=T_amb, dx=dx, dt=dt_al_half_h, T_s=T_s)
-    # biot_fireclay_half_h = cf.calc_biot(h_value=0.5*h_air, k_value=k_fireclay_478, thickness=thickness)
-    # dt_fireclay_half_h = cf.stability_analysis(h_value=0.5*h_air, k_value=k_fireclay_478, thickness=thickness,
-    #                                            rho=rho_fireclay_478, cp=cp_fireclay_478, dx=dx)
-    # delta_t_finite_diff_fireclay_half_h = cf.calc_finite_difference(fo=fo_fireclay, biot=biot_fireclay_half_h, T_i=T_i,
-    #                                                                 flux=heat_flux, k_value=k_fireclay_478,
-    #                                                                 thickness=thickness, width=width, T_amb=T_amb,
-    #                                                                 dx=dx, dt=dt_fireclay_half_h, T_s=T_s)
-    # biot_cast_iron_half_h = cf.calc_biot(h_value=h_air*0.5, k_value=k_cast_iron_300, thickness=thickness)
-    # dt_cast_iron_half_h = cf.stability_analysis(h_value=0.5*h_air, k_value=k_cast_iron_300, thickness=thickness,
-    #                                             rho=rho_cast_iron_300, cp=cp_cast_iron_300, dx=dx)
-    # delta_t_finite_diff_cast_iron_half_h = cf.calc_finite_difference(fo=fo_cast_iron, biot=biot_cast_iron_half_h,
-    #                                                                  T_i=T_i, flux=heat_flux, k_value=k_cast_iron_300,
-    #                                                                  thickness=thickness, width=width, T_amb=T_amb,
-    #                                                                  dx=dx, dt=dt_cast_iron_half_h, T_s=T_s)
-
     print("The time to heat to 250 degC for each material with the convective heat transfer coefficient halved is... ")
-    print("    Lumped Capacitance method, Aluminum: {}".format(round(delta_t_lumped_al_half_h, 2)))
-    print("    Lumped Capacitance method, Cast Iron: {}".format(round(delta_t_lumped_cast_iron_half_h, 2)))
-    print("    Lumped Capacitance method, Ceramic: {}".format(round(delta_t_lumped_fireclay_half_h, 2)))
-    # print("    Finite Difference method, Aluminum: {}".format(round(delta_t_finite_diff_al_half_h, 2)))
-    # print("    Finite Difference method, Cast Iron: {}".format(round(delta_t_finite_diff_cast_iron_half_h, 2)))
-    # print("    Finite Difference method, Ceramic: {}".format(round(delta_t_finite_diff_fireclay_half_h, 2)))
+    print_heat_up_times(results=results, task='task 6', finite_difference=finite_difference)
     print("...")
 
-    temp_at_half_time_to_op_temp_al = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air, rho=rho_al_300,
-                                                                 thickness=thickness, width=width, cp=cp_al_300,
-                                                                 flux=heat_flux, time=delta_t_lumped_al*0.5).to(ureg.degC)
-    temp_at_half_time_to_op_temp_cast_iron = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air,
-                                                                        rho=rho_cast_iron_300, thickness=thickness,
-                                                                        width=width, cp=cp_cast_iron_300,
-                                                                        flux=heat_flux, time=delta_t_lumped_cast_iron*0.5).to(ureg.degC)
-    temp_at_half_time_to_op_temp_fireclay = cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_air,
-                                                                       rho=rho_fireclay_478, thickness=thickness,
-                                                                       width=width, cp=cp_fireclay_478, flux=heat_flux,
-                                                                       time=delta_t_lumped_fireclay*0.5).to(ureg.degC)
-
     print("Plancha temp at half the time to operating temp:")
-    print("    Aluminum: {}".format(round(temp_at_half_time_to_op_temp_al, 2)))
-    print("    Cast Iron: {}".format(round(temp_at_half_time_to_op_temp_cast_iron, 2)))
-    print("    Ceramic: {}".format(round(temp_at_half_time_to_op_temp_fireclay, 2)))
+    for name in MATERIAL_NAMES:
+        print("    {}: {}".format(name, round(results[('task 6 half time', name, 'lumped')], 2)))
     print("...")
 
     print("dx = {}".format(dx))
-    print("aluminum dt = {}".format(dt_al))
-    print("cast iron dt = {}".format(dt_cast_iron))
-    print("ceramic dt = {}".format(dt_fireclay))
+    print("aluminum dt = {}".format(results[('analysis', 'Aluminum', None)][1]))
+    print("cast iron dt = {}".format(results[('analysis', 'Cast Iron', None)][1]))
+    print("ceramic dt = {}".format(results[('analysis', 'Ceramic', None)][1]))
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Plancha heat transfer report')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: one per core, 1 runs in-process)')
+    parser.add_argument('--finite-difference', action='store_true',
+                        help='also run the finite difference heat-up jobs')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory for cached job results, reused across runs (default: no cache)')
+    args = parser.parse_args()
+    main(max_workers=args.workers, finite_difference=args.finite_difference, cache_dir=args.cache_dir)
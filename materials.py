@@ -0,0 +1,97 @@
+"""
+Temperature-dependent material properties. Tabulated k(T), cp(T) and rho(T) are held in a registry
+and resampled into dense, uniformly spaced lookup tables that the finite difference kernel queries
+for the whole grid each step. Tables are memoized per material and temperature range.
+
+Data: Incropera, Fundamentals of Heat and Mass Transfer, Tables A.1 and A.3. Density is only
+tabulated at 300 K and is held constant.
+"""
+
+from __init__ import ureg, Q_
+from functools import lru_cache
+import numpy as np
+
+# name: temperatures (K) and the property values at those temperatures, in SI units
+MATERIALS = {
+    'aluminum': {'T': [100, 200, 300, 400, 600, 800],
+                 'k_value': [302, 237, 237, 240, 231, 218],
+                 'cp': [482, 798, 903, 949, 1033, 1146],
+                 'rho': [2702] * 6},
+    'plain carbon steel': {'T': [300, 400, 600, 800, 1000],
+                           'k_value': [60.5, 56.7, 48.0, 39.2, 30.0],
+                           'cp': [434, 487, 559, 685, 1169],
+                           'rho': [7854] * 5},
+    'fireclay brick': {'T': [478, 922, 1478],
+                       'k_value': [1.0, 1.5, 1.8],
+                       'cp': [960] * 3,
+                       'rho': [2645] * 3},
+    'stainless steel 304': {'T': [100, 200, 300, 400, 600, 800],
+                            'k_value': [9.2, 12.6, 14.9, 16.6, 19.8, 22.6],
+                            'cp': [272, 402, 477, 515, 557, 582],
+                            'rho': [7900] * 6},
+    'copper': {'T': [100, 200, 300, 400, 600, 800],
+               'k_value': [482, 413, 401, 393, 379, 366],
+               'cp': [252, 356, 385, 397, 417, 433],
+               'rho': [8933] * 6},
+}
+
+PROPERTY_UNITS = {'k_value': 'watt / meter / kelvin', 'cp': 'joule / kilogram / kelvin', 'rho': 'kilogram / meter ** 3'}
+
+
+def register_material(name=None, T=None, k_value=None, cp=None, rho=None):
+    """
+    Add or replace a material. T is a sequence of temperatures and k_value, cp and rho are sequences of
+    the same length, as Quantities or plain SI values.
+    """
+    def mag(values, units):
+        return [v.m_as(units) if isinstance(v, ureg.Quantity) else v for v in np.atleast_1d(values)]
+    MATERIALS[name] = {'T': mag(T, ureg.degK), 'k_value': mag(k_value, PROPERTY_UNITS['k_value']),
+                       'cp': mag(cp, PROPERTY_UNITS['cp']), 'rho': mag(rho, PROPERTY_UNITS['rho'])}
+    property_table.cache_clear()
+
+
+def material_properties(name=None, T=None):
+    # Interpolated rho, cp and k_value at temperature T, as Quantities
+    data = MATERIALS[name]
+    T = T.m_as(ureg.degK) if isinstance(T, ureg.Quantity) else T
+    return {prop: Q_(np.interp(T, data['T'], data[prop]), units) for prop, units in PROPERTY_UNITS.items()}
+
+
+class PropertyTable:
+    """
+    Dense, uniformly spaced resampling of one material's tabulated properties between T_min and T_max.
+    Lookups are a vectorized index-and-blend with no search, and are clamped at the table ends.
+    """
+    def __init__(self, name=None, T_min=None, T_max=None, n_points=None):
+        data = MATERIALS[name]
+        self.name = name
+        self.T_min = T_min
+        self.dT = (T_max - T_min) / (n_points - 1)
+        self.T = np.linspace(T_min, T_max, n_points)
+        self.k_value = np.interp(self.T, data['T'], data['k_value'])
+        self.cp = np.interp(self.T, data['T'], data['cp'])
+        self.rho = np.interp(self.T, data['T'], data['rho'])
+        self.alpha = self.k_value / (self.rho * self.cp)
+
+    def lookup(self, values=None, T=None):
+        # values is one of the dense property arrays, e.g. table.k_value; T is an array in kelvin
+        x = np.clip((T - self.T_min) / self.dT, 0, self.T.size - 1)
+        i = np.minimum(x.astype(int), self.T.size - 2)
+        frac = x - i
+        return values[i] * (1 - frac) + values[i + 1] * frac
+
+
+@lru_cache(maxsize=64)
+def property_table(name=None, T_min=None, T_max=None, n_points=1024):
+    """
+    Memoized PropertyTable for a material and temperature range. T_min and T_max default to the
+    tabulated range of the material.
+    """
+    data = MATERIALS[name]
+    T_min = min(data['T']) if T_min is None else T_min
+    T_max = max(data['T']) if T_max is None else T_max
+    return PropertyTable(name=name, T_min=T_min, T_max=T_max, n_points=n_points)
+
+
+if __name__ == "__main__":
+    print('Executed')
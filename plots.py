@@ -1,10 +1,36 @@
 """
 Plots
+
+matplotlib and numpy are imported inside each function, so importing this module costs nothing
+for runs that never plot.
+
+The batch pipeline renders headless (Agg) to files: render_plots spreads many Plot descriptions
+over a process pool, and each worker reuses one figure and its artists for every plot of a kind.
+animate_snapshots streams saved field snapshots into an animation one frame at a time.
 """
 
 from __init__ import ureg, Q_
-import matplotlib.pyplot as plt
-import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+# kind is 'curves' (data = (times, temps), temps of shape (curves, samples) or (samples,), one label
+# per curve) or 'field' (data = a (rows, cols) temperature field, labels unused). name is the file stem.
+Plot = namedtuple('Plot', ['name', 'kind', 'data', 'labels', 'title'])
+
+
+def _magnitude(value):
+    import numpy as np
+    return np.asarray(getattr(value, 'magnitude', value))
+
+
+def _field_extent(shape, dx):
+    # Image extent in cm across the width and mm through the thickness, or node indices without dx
+    rows, cols = shape
+    if dx is None:
+        return [-0.5, cols - 0.5, -0.5, rows - 0.5]
+    dx = dx.m_as(ureg.meter) if hasattr(dx, 'm_as') else dx
+    return [0., cols * dx * 100, 0., rows * dx * 1000]
 
 
 # Not currently used
@@ -13,9 +39,11 @@ def plot_top_center_temp_vs_time(time_array=None, temp_array=None):
     Generate a plot of top center surface temperature versus time during the heating process
     for these three materials using both the lumped capacitance and finite difference methods.
     """
-    # Convert to base units before creating numpy array for plotting
-    x = np.array([time.magnitude for time in time_array])
-    y = np.array([temp.magnitude for temp in temp_array])
+    import matplotlib.pyplot as plt
+
+    # Histories come from the solver as preallocated Quantity arrays, so strip units without copying
+    x = _magnitude(time_array)
+    y = _magnitude(temp_array)
 
     # Set up plots
     plt.plot(x, y)
@@ -28,17 +56,25 @@ def plot_top_center_temp_vs_time(time_array=None, temp_array=None):
 
 
 # Not currently used
-def plot_temp_profile_at_half_time(temp_profile=None):
+def plot_temp_profile_at_half_time(temp_profile=None, dx=None):
     """
     Show a 2D plot of the temperature profile across the full plancha at one-half of
     the time to heat up for the material that is slowest to come to operating temperature.
+    A (rows, cols) field is drawn as a heatmap with the heated bottom (row 0) at the bottom,
+    scaled by the node spacing dx if given. A 1D profile is drawn as a line.
     """
+    import matplotlib.pyplot as plt
+    import numpy as np
+
     # Convert to base units before creating numpy array for plotting
-    data = temp_profile.magnitude
-    coord = np.arange(data.shape)
+    data = _magnitude(temp_profile)
 
     # Set up plots
-    plt.plot(coord, data)
+    if data.ndim == 2:
+        image = plt.imshow(data, origin='lower', aspect='auto', extent=_field_extent(data.shape, dx))
+        plt.colorbar(image, label='Temp (Kelvin)')
+    else:
+        plt.plot(np.arange(data.size), data)
 
     plt.title('Temperature profile at half time')
     plt.ylabel('Thickness (mm)')
@@ -46,3 +82,153 @@ def plot_temp_profile_at_half_time(temp_profile=None):
 
     # plot
     plt.show()
+
+
+class CurveRenderer:
+    """
+    Temperature-vs-time figure rendered with Agg. The figure, axes and lines are created once and
+    their data replaced for each plot. Lines are added as needed and hidden when unused.
+    """
+    def __init__(self, figsize=(6.4, 4.8), dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel('Time (seconds)')
+        self.axes.set_ylabel('Temp (Kelvin)')
+        self.lines = []
+
+    def render(self, path=None, times=None, temps=None, labels=None, title='Plancha surface temp over time'):
+        # times is one shared axis or one per curve
+        temps = _magnitude(temps)
+        temps = temps.reshape(-1, temps.shape[-1])
+        times = _magnitude(times)
+        times = times.reshape(-1, times.shape[-1])
+        n_curves = temps.shape[0]
+        while len(self.lines) < n_curves:
+            self.lines.extend(self.axes.plot([], []))
+        for i, line in enumerate(self.lines):
+            line.set_visible(i < n_curves)
+            if i < n_curves:
+                line.set_data(times[i % times.shape[0]], temps[i])
+                line.set_label('_nolegend_' if labels is None else labels[i])
+        self.axes.relim(visible_only=True)
+        self.axes.autoscale_view()
+        self.axes.set_title(title)
+        if self.axes.get_legend() is not None:
+            self.axes.get_legend().remove()
+        if labels is not None:
+            self.axes.legend(handles=self.lines[:n_curves])
+        self.figure.savefig(path)
+        return path
+
+
+class FieldRenderer:
+    """
+    Heatmap of a (rows, cols) temperature field rendered with Agg, with the heated bottom (row 0)
+    at the bottom. The image and colorbar are created on the first plot and updated in place after.
+    """
+    def __init__(self, figsize=(8., 3.), dpi=100, dx=None):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        # Fixed margins: a layout engine would be solved again for every frame
+        self.figure.subplots_adjust(left=0.08, right=0.98, bottom=0.17, top=0.88)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel('Width (cm)' if dx is not None else 'Column')
+        self.axes.set_ylabel('Thickness (mm)' if dx is not None else 'Row')
+        self.dx = dx
+        self.image = None
+        self.colorbar = None
+
+    def update(self, field=None, title=None, vmin=None, vmax=None):
+        field = _magnitude(field)
+        if self.image is not None and self.image.get_array().shape == field.shape:
+            self.image.set_data(field)
+        else:
+            # First plot, or a different grid: rebuild the image and point the colorbar at it
+            if self.image is not None:
+                self.image.remove()
+            self.image = self.axes.imshow(field, origin='lower', aspect='auto',
+                                          extent=_field_extent(field.shape, self.dx))
+            if self.colorbar is None:
+                self.colorbar = self.figure.colorbar(self.image, ax=self.axes, label='Temp (Kelvin)')
+            else:
+                self.colorbar.update_normal(self.image)
+        self.image.set_clim(field.min() if vmin is None else vmin, field.max() if vmax is None else vmax)
+        if title is not None:
+            self.axes.set_title(title)
+
+    def render(self, path=None, field=None, title='Temperature profile', vmin=None, vmax=None):
+        self.update(field=field, title=title, vmin=vmin, vmax=vmax)
+        self.figure.savefig(path)
+        return path
+
+
+def _render_chunk(plots=None, directory=None, fmt='png', dpi=100, dx=None):
+    # One renderer of each kind per worker, reused for every plot in the chunk
+    renderers = {}
+    paths = []
+    for plot in plots:
+        path = os.path.join(directory, '{}.{}'.format(plot.name, fmt))
+        if plot.kind == 'curves':
+            if 'curves' not in renderers:
+                renderers['curves'] = CurveRenderer(dpi=dpi)
+            paths.append(renderers['curves'].render(path, times=plot.data[0], temps=plot.data[1],
+                                                    labels=plot.labels,
+                                                    title=plot.title or 'Plancha surface temp over time'))
+        elif plot.kind == 'field':
+            if 'field' not in renderers:
+                renderers['field'] = FieldRenderer(dpi=dpi, dx=dx)
+            paths.append(renderers['field'].render(path, field=plot.data, title=plot.title or 'Temperature profile'))
+        else:
+            raise ValueError("Unknown plot kind '{}'".format(plot.kind))
+    return paths
+
+
+def render_plots(plots=None, directory=None, max_workers=None, fmt='png', dpi=100, dx=None):
+    """
+    Render every Plot in plots to '<directory>/<name>.<fmt>' without a display. The plots are split
+    into one contiguous chunk per worker of a ProcessPoolExecutor (default: one per core, 1 renders
+    in-process). dx scales field heatmaps to cm/mm. Returns the file paths in the order of plots.
+    """
+    os.makedirs(directory, exist_ok=True)
+    kwargs = dict(directory=directory, fmt=fmt, dpi=dpi, dx=dx)
+    if max_workers == 1 or len(plots) <= 1:
+        return _render_chunk(plots=plots, **kwargs)
+    n_chunks = min(max_workers or os.cpu_count() or 1, len(plots))
+    size = -(-len(plots) // n_chunks)
+    with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+        futures = [pool.submit(_render_chunk, plots=plots[i:i + size], **kwargs)
+                   for i in range(0, len(plots), size)]
+        return [path for future in futures for path in future.result()]
+
+
+def animate_snapshots(path=None, output=None, fps=10, every=1, dpi=100, dx=None, vmin=None, vmax=None):
+    """
+    Animate the fields written by recorders.SnapshotWriter at path into output (.gif with Pillow,
+    other extensions with ffmpeg). Frames are read from the memory-mapped file one at a time, so the
+    history is never loaded whole. ffmpeg also streams the encoded frames to disk; Pillow keeps them
+    in memory until the GIF is written. every skips frames. Color limits default to the range over all
+    frames, which is found in one streaming pass.
+    """
+    import numpy as np
+    from matplotlib import animation
+    from recorders import load_snapshots
+
+    times, fields = load_snapshots(path)
+    frames = range(0, len(times), every)
+    if vmin is None or vmax is None:
+        lows, highs = zip(*((np.min(fields[i]), np.max(fields[i])) for i in frames))
+        vmin = min(lows) if vmin is None else vmin
+        vmax = max(highs) if vmax is None else vmax
+
+    renderer = FieldRenderer(dpi=dpi, dx=dx)
+    writer = animation.PillowWriter(fps=fps) if output.endswith('.gif') else animation.FFMpegWriter(fps=fps)
+    with writer.saving(renderer.figure, output, dpi):
+        for i in frames:
+            renderer.update(field=fields[i], title='t = {:.1f} s'.format(times[i]), vmin=vmin, vmax=vmax)
+            writer.grab_frame()
+    return output
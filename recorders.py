@@ -0,0 +1,182 @@
+"""
+Recorders for the finite difference time march. Probe histories are kept in preallocated float
+arrays and full-field snapshots are streamed to a memory-mapped .npy file, so long, fine-grid runs
+keep a flat memory footprint. Both can be decimated to every N steps or every interval seconds.
+Checkpoints of the solver state use the same decimation, so interrupted runs can be resumed.
+"""
+
+import os
+import numpy as np
+
+
+class _Decimated:
+    """
+    Decides which steps are recorded: every `every` steps, or once per `interval` seconds of
+    simulated time when interval is given.
+    """
+    def __init__(self, every=1, interval=None):
+        self.every = every
+        self.interval = interval
+        self._next_time = 0.
+
+    def _capacity(self, n_steps, dt):
+        # Upper bound on the number of recorded samples for n_steps record calls
+        if self.interval is None:
+            return -(-n_steps // self.every)
+        return min(n_steps, int((n_steps - 1) * dt / self.interval) + 2)
+
+    def _due(self, step, time):
+        if self.interval is None:
+            return step % self.every == 0
+        if time < self._next_time:
+            return False
+        self._next_time = (np.floor(time / self.interval) + 1) * self.interval
+        return True
+
+
+class ProbeRecorder(_Decimated):
+    """
+    Preallocated temperature history of one or more probe nodes. probes is a list of (row, col)
+    nodes and defaults to the top center of the grid. If the solver passes a surface function to
+    start, probes in the top row record the top surface temperature it returns.
+    """
+    def __init__(self, probes=None, every=1, interval=None):
+        super().__init__(every=every, interval=interval)
+        self.probes = probes
+        self.count = 0
+
+    def start(self, shape=None, n_steps=None, dt=None, symmetric=False, surface=None):
+        # With symmetric=True the recorded fields are the left half of a (rows, cols) grid
+        rows, cols = shape
+        probes = [(rows-1, int(0.5*(cols-1)))] if self.probes is None else self.probes
+        self.probe_rows, self.probe_cols = np.array(probes, dtype=int).reshape(-1, 2).T
+        if symmetric:
+            self.probe_cols = np.minimum(self.probe_cols, cols-1 - self.probe_cols)
+        self.surface = surface
+        self._top = self.probe_rows == rows-1
+        capacity = self._capacity(n_steps, dt)
+        self._times = np.empty(shape=capacity)
+        self._temps = np.empty(shape=[capacity, self.probe_rows.size])
+        self._next_time = 0.
+        self.count = 0
+
+    def record(self, step=None, time=None, field=None):
+        if self.count == self._times.size or not self._due(step, time):
+            return
+        self._times[self.count] = time
+        temps = field[self.probe_rows, self.probe_cols]
+        if self.surface is not None:
+            temps[self._top] = self.surface(temps[self._top])
+        self._temps[self.count] = temps
+        self.count += 1
+
+    @property
+    def times(self):
+        return self._times[:self.count]
+
+    @property
+    def temps(self):
+        # (samples, probes) view of the recorded history
+        return self._temps[:self.count]
+
+    def state(self):
+        # Recorded history and decimation position, for checkpoints
+        return {'recorder_times': self.times, 'recorder_temps': self.temps, 'recorder_next_time': self._next_time}
+
+    def restore(self, state=None):
+        # Continue a history saved by state(). Call after start(), which sizes the buffers for the new horizon.
+        count = min(state['recorder_times'].size, self._times.size)
+        if state['recorder_temps'].shape[1:] != self._temps.shape[1:]:
+            raise ValueError("Checkpoint was recorded with different probes")
+        self._times[:count] = state['recorder_times'][:count]
+        self._temps[:count] = state['recorder_temps'][:count]
+        self._next_time = float(state['recorder_next_time'])
+        self.count = count
+
+
+class SnapshotWriter(_Decimated):
+    """
+    Streams full temperature fields into a preallocated memory-mapped .npy file at path, with the
+    snapshot times in a companion '<name>_times.npy' file. Reload with load_snapshots.
+    """
+    def __init__(self, path=None, every=1, interval=None):
+        super().__init__(every=every, interval=interval)
+        self.path = path
+        self.count = 0
+
+    def start(self, shape=None, n_steps=None, dt=None, symmetric=False):
+        # With symmetric=True each half-width field is mirrored back to the full shape when written
+        self._full_cols = shape[1] if symmetric else None
+        capacity = self._capacity(n_steps, dt)
+        self._fields = np.lib.format.open_memmap(self.path, mode='w+', dtype=float, shape=(capacity,) + tuple(shape))
+        self._times = np.full(shape=capacity, fill_value=np.nan)
+        self._next_time = 0.
+        self.count = 0
+
+    def record(self, step=None, time=None, field=None):
+        if self.count == self._times.size or not self._due(step, time):
+            return
+        self._fields[self.count] = field if self._full_cols is None else unfold_symmetric(field, self._full_cols)
+        self._times[self.count] = time
+        self.count += 1
+
+    def close(self):
+        # Unused frames (e.g. after an early stop) keep a NaN time and are dropped on load
+        self._fields.flush()
+        np.save(_times_path(self.path), self._times)
+        del self._fields
+
+
+class Checkpointer(_Decimated):
+    """
+    Writes the finite difference solver state to the .npz file at path every `every` steps, or once
+    per `interval` seconds of simulated time, and once more when the march ends. Each write replaces
+    the previous checkpoint atomically, so an interrupted run always leaves a complete file.
+    Reload with load_checkpoint.
+    """
+    def __init__(self, path=None, every=1000, interval=None):
+        super().__init__(every=every, interval=interval)
+        self.path = path
+        self.count = 0
+
+    def due(self, step=None, time=None):
+        return self._due(step, time)
+
+    def save(self, state=None):
+        # Write to a temporary file and rename it over the old checkpoint
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, **state)
+        os.replace(tmp, self.path)
+        self.count += 1
+
+
+def load_checkpoint(path=None):
+    # Solver state written by Checkpointer, as a dict of arrays
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def unfold_symmetric(half=None, cols=None):
+    # Rebuild the full (rows, cols) field from the left half solved with a symmetry boundary
+    mirror = half[..., ::-1]
+    return np.concatenate([half, mirror[..., 1:] if cols % 2 else mirror], axis=-1)
+
+
+def _times_path(path):
+    return os.path.splitext(path)[0] + '_times.npy'
+
+
+def load_snapshots(path=None):
+    """
+    Reload snapshots written by SnapshotWriter without copying: the fields come back as a read-only
+    memmap view of shape (snapshots, rows, cols) along with their times in seconds.
+    """
+    times = np.load(_times_path(path))
+    count = int(np.count_nonzero(~np.isnan(times)))
+    fields = np.load(path, mmap_mode='r')
+    return times[:count], fields[:count]
+
+
+if __name__ == "__main__":
+    print('Executed')
@@ -0,0 +1,166 @@
+"""
+Content-addressed result cache. A result is keyed by a hash of the function name, its inputs
+converted to SI base units and SOLVER_VERSION, so runs with the same physics share an entry,
+whatever units the inputs were given in. Results are kept in an in-process memo, and optionally
+as compressed .npz files in a directory. The directory is bounded in size and evicts the least
+recently used entries first.
+"""
+
+from __init__ import ureg, Q_
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import numpy as np
+from calc_functions import SOLVER_VERSION
+
+
+def _normalize(value):
+    # JSON-serializable form of an input. Quantities are converted to SI base units first.
+    if isinstance(value, ureg.Quantity):
+        value = value.to_base_units()
+        return {'magnitude': _normalize(value.magnitude), 'units': str(value.units)}
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return {'dtype': value.dtype.str, 'shape': value.shape,
+                'sha256': hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()}
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    if value is None or isinstance(value, (int, np.integer, str)):
+        return value
+    if callable(value):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    raise TypeError("Cannot build a cache key from {!r}".format(type(value).__name__))
+
+
+def cache_key(func=None, kwargs=None):
+    """
+    Stable hex digest of func, its keyword inputs and SOLVER_VERSION.
+    """
+    payload = json.dumps({'func': _normalize(func), 'kwargs': _normalize(kwargs or {}), 'version': SOLVER_VERSION},
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _encode(result):
+    # Flatten a Quantity, array, number or tuple of them into arrays for np.savez
+    items = result if isinstance(result, tuple) else (result,)
+    arrays = {'tuple': np.array(isinstance(result, tuple))}
+    for i, item in enumerate(items):
+        magnitude = item.magnitude if isinstance(item, ureg.Quantity) else item
+        arrays['magnitude_{}'.format(i)] = np.asarray(magnitude)
+        arrays['units_{}'.format(i)] = np.array(str(item.units) if isinstance(item, ureg.Quantity) else '')
+        arrays['scalar_{}'.format(i)] = np.array(np.ndim(magnitude) == 0 and not isinstance(magnitude, np.ndarray))
+    return arrays
+
+
+def _freeze(result):
+    # Read-only copy of a result, so that changing a returned array in place cannot alter later cache hits
+    if isinstance(result, tuple):
+        return tuple(_freeze(item) for item in result)
+    magnitude = result.magnitude if isinstance(result, ureg.Quantity) else result
+    if not isinstance(magnitude, np.ndarray):
+        return result
+    magnitude = magnitude.copy()
+    magnitude.flags.writeable = False
+    return Q_(magnitude, result.units) if isinstance(result, ureg.Quantity) else magnitude
+
+
+def _decode(arrays):
+    items = []
+    for i in range(sum(name.startswith('magnitude_') for name in arrays)):
+        magnitude = arrays['magnitude_{}'.format(i)]
+        magnitude = magnitude.item() if arrays['scalar_{}'.format(i)] else magnitude
+        units = str(arrays['units_{}'.format(i)])
+        items.append(Q_(magnitude, units) if units else magnitude)
+    return tuple(items) if arrays['tuple'] else items[0]
+
+
+class ResultCache:
+    """
+    Memoize function results by cache_key. memo_size results are held in memory. If directory is
+    given, results are also written there as <key>.npz, and the least recently used files are deleted
+    once the directory holds more than max_bytes.
+
+    Results must be Quantities, arrays, numbers or tuples of them. Inputs that cannot be hashed
+    (recorders, callbacks) raise TypeError. Arrays are memoized and returned as read-only copies.
+    """
+    def __init__(self, directory=None, max_bytes=256 * 2**20, memo_size=256):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _remember(self, key, result):
+        result = _freeze(result)
+        self._memo[key] = result
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return result
+
+    def get(self, key):
+        # Cached result for key, or None
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return self._memo[key]
+        if self.directory is not None and os.path.exists(self._path(key)):
+            with np.load(self._path(key), allow_pickle=False) as data:
+                result = _decode({name: data[name] for name in data.files})
+            # The modification time doubles as the last-use time for eviction
+            os.utime(self._path(key))
+            self.hits += 1
+            return self._remember(key, result)
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        # Store result and return the read-only copy that later hits will see
+        frozen = self._remember(key, result)
+        if self.directory is None:
+            return frozen
+        # Write then rename, so a concurrent reader never sees a partial file
+        tmp = self._path(key) + '.{}.tmp'.format(os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **_encode(result))
+        os.replace(tmp, self._path(key))
+        self._evict()
+        return frozen
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def call(self, func=None, **kwargs):
+        # func(**kwargs), served from the cache when the same inputs have been seen before
+        key = cache_key(func=func, kwargs=kwargs)
+        result = self.get(key)
+        if result is None:
+            result = self.put(key, func(**kwargs))
+        return result
+
+
+if __name__ == "__main__":
+    print('Executed')
@@ -0,0 +1,110 @@
+"""
+Scenario runner: each task/material/method combination is described as an independent job and the
+jobs are executed on a process pool.
+"""
+
+from __init__ import ureg, Q_
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import calc_functions as cf
+from result_cache import cache_key
+
+# func must be a module-level function so it can be pickled to the worker processes
+Job = namedtuple('Job', ['task', 'material', 'method', 'func', 'kwargs'])
+
+
+def run_jobs(jobs=None, max_workers=None, cache=None):
+    """
+    Execute jobs on a ProcessPoolExecutor with max_workers processes (default: one per core) and
+    return the results keyed by (task, material, method). max_workers=1 runs the jobs in-process.
+    With a ResultCache, jobs whose inputs were seen before are served from it and only the rest run.
+    """
+    keys = [None if cache is None else cache_key(func=job.func, kwargs=job.kwargs) for job in jobs]
+    results = [None if cache is None else cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if max_workers == 1:
+        for i in pending:
+            results[i] = jobs[i].func(**jobs[i].kwargs)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(jobs[i].func, **jobs[i].kwargs) for i in pending]
+            for i, future in zip(pending, futures):
+                results[i] = future.result()
+    if cache is not None:
+        for i in pending:
+            cache.put(keys[i], results[i])
+    return {(job.task, job.material, job.method): result for job, result in zip(jobs, results)}
+
+
+def analysis_numbers(material=None, h_value=None, thickness=None, dx=None):
+    # Biot number, stable time step and Fourier number for one material
+    biot = cf.calc_biot(h_value=h_value, k_value=material['k_value'], thickness=thickness)
+    dt = cf.stability_analysis(h_value=h_value, k_value=material['k_value'], thickness=thickness,
+                               rho=material['rho'], cp=material['cp'], dx=dx)
+    fo = cf.calc_fo(k_value=material['k_value'], rho=material['rho'], cp=material['cp'], delta_t=dt, delta_x=dx)
+    return biot, dt, fo
+
+
+def lumped_heat_up_time(material=None, h_value=None, thickness=None, width=None, flux=None, T_amb=None, T_i=None,
+                        T_s=None):
+    # Time for the plancha to reach T_s with the lumped capacitance method
+    return cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_value, rho=material['rho'],
+                                      thickness=thickness, width=width, cp=material['cp'], flux=flux,
+                                      T_final=T_s).to(ureg.seconds)
+
+
+def lumped_stored_energy(material=None, h_value=None, thickness=None, width=None, flux=None, T_amb=None, T_i=None,
+                         T_s=None):
+    # Energy stored per length when the plancha reaches T_s with the lumped capacitance method
+    time = lumped_heat_up_time(material=material, h_value=h_value, thickness=thickness, width=width, flux=flux,
+                               T_amb=T_amb, T_i=T_i, T_s=T_s)
+    energy_per_time = cf.calc_stored_energy_per_time(rho=material['rho'], thickness=thickness, width=width,
+                                                     cp=material['cp'], T_i=T_i, T_final=T_s, time=time)
+    return (energy_per_time * time).to(ureg.kjoules / ureg.meters)
+
+
+def lumped_temp_at_half_time(material=None, h_value=None, thickness=None, width=None, flux=None, T_amb=None,
+                             T_i=None, T_s=None):
+    # Lumped plancha temp at half the time to reach T_s
+    time = lumped_heat_up_time(material=material, h_value=h_value, thickness=thickness, width=width, flux=flux,
+                               T_amb=T_amb, T_i=T_i, T_s=T_s)
+    return cf.calc_lumped_capacitance(T_amb=T_amb, T_i=T_i, h_value=h_value, rho=material['rho'],
+                                      thickness=thickness, width=width, cp=material['cp'], flux=flux,
+                                      time=time * 0.5).to(ureg.degC)
+
+
+def finite_difference_heat_up_time(material=None, h_value=None, thickness=None, width=None, flux=None, T_amb=None,
+                                   T_i=None, T_s=None, dx=None, time=3100., method='explicit'):
+    # Time for the top center of the plancha to reach T_s with the finite difference method
+    biot, dt, fo = analysis_numbers(material=material, h_value=h_value, thickness=thickness, dx=dx)
+    time_to_operating_temp = cf.calc_finite_difference(fo=fo, biot=biot, T_i=T_i, flux=flux,
+                                                       k_value=material['k_value'], thickness=thickness,
+                                                       width=width, T_amb=T_amb, dx=dx, time=time, dt=dt, T_s=T_s,
+                                                       method=method, stop_at_target=True)[0]
+    return time_to_operating_temp
+
+
+def finite_difference_steady_state(material=None, h_value=None, thickness=None, width=None, flux=None, T_amb=None,
+                                   dx=None):
+    # Steady top center temperature from the direct sparse finite difference solve
+    biot = cf.calc_biot(h_value=h_value, k_value=material['k_value'], thickness=thickness)
+    return cf.calc_steady_state_field(biot=biot, flux=flux, k_value=material['k_value'], thickness=thickness,
+                                      width=width, T_amb=T_amb, dx=dx)[1].to(ureg.degC)
+
+
+def convection_heat_loss(h_value=None, thickness=None, width=None, T_amb=None, T_plancha=None):
+    return cf.calc_convection_heat_loss(h_value=h_value, thickness=thickness, width=width, T_amb=T_amb,
+                                        T_plancha=T_plancha)
+
+
+def steady_state(flux=None, h_value=None, thickness=None, width=None, T_amb=None):
+    # Lumped steady state temperature and the convection loss at that temperature
+    T_ss = cf.calc_steady_state_temp(flux=flux, h_value=h_value, width=width, thickness=thickness,
+                                     T_amb=T_amb).to(ureg.degC)
+    conv_loss = cf.calc_convection_heat_loss(h_value=h_value, thickness=thickness, width=width, T_amb=T_amb,
+                                             T_plancha=T_ss).to(ureg.watts / ureg.meters)
+    return T_ss, conv_loss
+
+
+if __name__ == "__main__":
+    print('Executed')